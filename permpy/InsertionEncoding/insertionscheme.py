@@ -2,8 +2,10 @@ from permpy.permutation import Permutation
 from permpy.avclass import AvClass
 from permpy.permset import PermSet
 from permpy.InsertionEncoding.configuration import Configuration
+from permpy.storage import dump_checkpoint, load_checkpoint
 import sympy
 import random
+import time
 
 class InsertionScheme():
   _tree = {}
@@ -61,9 +63,34 @@ class InsertionScheme():
     return config
 
 
-  def build_rules(self, verbose=True, make_class=False, class_bound=100):
+  def build_rules(self, verbose=True, make_class=False, class_bound=100,
+                  checkpoint=None, checkpoint_interval=600, resume_from=None):
+    """Builds the automaton of the insertion encoding by reducing
+    configurations. If `checkpoint` is given, the configurations left to
+    check, the tree, the automaton and the reductions found so far are
+    written to that path every `checkpoint_interval` seconds (see
+    `storage.dump_checkpoint`), and `resume_from` continues from such a file."""
     configs_to_check = [Configuration((0,), self._basis)]
+    if resume_from is not None:
+      (state, items) = load_checkpoint(resume_from)
+      configs_to_check = state['configs_to_check']
+      self._configs_checked = state['configs_checked']
+      self._tree = state['tree']
+      self._automaton = state['automaton']
+      self._reductions = state['reductions']
+      self._basis = state['basis']
+      if make_class and state['class_length'] > len(self._class) - 1:
+        self._class.extend_to_length(state['class_length'])
+    written = time.time()
     while len(configs_to_check) > 0:
+      if checkpoint is not None and time.time() - written >= checkpoint_interval:
+        state = {'configs_to_check': configs_to_check,
+                 'configs_checked': self._configs_checked,
+                 'tree': self._tree, 'automaton': self._automaton,
+                 'reductions': self._reductions, 'basis': self._basis,
+                 'class_length': len(self._class) - 1}
+        dump_checkpoint(checkpoint, state)
+        written = time.time()
       if verbose:
         # print '\tstates to check:',len(configs_to_check),',   nodes in tree:',len(self._tree.keys()),',   states:', len(self._automaton)
         s_to_print = '\tstates to check: {}, nodes in tree: {}, states: {}'.format(
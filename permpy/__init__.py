@@ -1,7 +1,9 @@
-from .permset import PermSet
+from .permset import PermSet, IndexedPermSet
 from .permutation import Permutation
 from .pegpermutation import PegPermutation
 from .permclass import PermClass
+from .bitmapset import BitmapLevel
+from .packedpermset import PackedPermSet
 from .avclass import AvClass
 from .pegpermset import PegPermSet
 from .geometricgridclass import GeometricGridClass
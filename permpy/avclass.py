@@ -1,10 +1,375 @@
 from math import factorial
+from collections import Counter
+import itertools
+import time
 import types
 
+try:
+    import numpy as np
+except ImportError:
+    pass
+
 import permpy.permset
 import permpy.permclass
 from permpy.permutation import Permutation
 from permpy.permset import PermSet
+from permpy import symmetries
+from permpy import enumcache
+from permpy.packedpermset import pack_array
+
+
+# Statistics which can be updated in constant time when a permutation `P` of
+# length n is grown by a right extension with new last entry `i` (so entries of
+# `P` which are at least `i` are shifted up by one). Each entry maps the name
+# of the statistic to a pair (value on the permutation 1, update function).
+INCREMENTAL_STATS = {
+    'descents': (0, lambda v, P, i: v + (1 if P[-1] >= i else 0)),
+    'inversions': (0, lambda v, P, i: v + len(P) - i),
+    'majorindex': (0, lambda v, P, i: v + (len(P) if P[-1] >= i else 0)),
+    'num_ltrmax': (1, lambda v, P, i: v + (1 if i == len(P) else 0)),
+    'last_entry': (0, lambda v, P, i: i),
+}
+
+
+# levels with fewer parents are extended in the calling process
+PARALLEL_THRESHOLD = 1000
+
+# Directions in which permutations can be grown. The class is generated by
+# right extensions of the images of its members under the first symmetry (see
+# `symmetries.SYMMETRIES`), which avoid the images of the basis, and the
+# generated permutations are mapped back by the second symmetry.
+DIRECTIONS = {
+    'right': (0, 0),    # new last entry
+    'left': (1, 1),     # new first entry
+    'top': (4, 4),      # new maximum
+    'bottom': (5, 6),   # new minimum
+}
+
+# direction in which right extensions of the images of permutations under
+# each symmetry (see `symmetries.SYMMETRIES`) grow the permutations
+SYMMETRY_DIRECTIONS = ('right', 'left', 'right', 'left',
+                       'top', 'bottom', 'top', 'bottom')
+
+# length up to which each direction is tried when choosing one automatically
+DIRECTION_ESTIMATE_LENGTH = 7
+
+# shortest length for which a direction is chosen automatically: below it,
+# trying every direction costs a large part of generating the class
+DIRECTION_CHOICE_LENGTH = DIRECTION_ESTIMATE_LENGTH + 3
+
+# cost of mapping an entry back to the class, in entries scanned (measured:
+# an entry is mapped back in about a tenth of the time it takes to scan one
+# in the searches for forbidden sites)
+MAP_BACK_COST = 0.1
+
+# fraction of the cost of 'right' below which another direction is chosen
+DIRECTION_MARGIN = 0.8
+
+# number of parents between two reorderings of the basis elements
+REORDER_INTERVAL = 1 << 12
+
+
+def _basis_prefixes(basis):
+    """Precomputes, for each basis element B, the data used by
+    `_forbidden_sites`: the prefix A of B without its last entry, for each
+    index t of A the indices of the entries after t whose values are just
+    below and just above A[t] (or None), the indices in A of the values just
+    below and just above the last entry of B (or None) and the smallest of
+    them, and the index of B in `basis`."""
+    prefixes = []
+    for (index, B) in enumerate(basis):
+        A = list(B[:-1])
+        lower = []
+        upper = []
+        for t in range(len(A)):
+            later = range(t+1, len(A))
+            below = [s for s in later if A[s] < A[t]]
+            above = [s for s in later if A[s] > A[t]]
+            lower.append(max(below, key=lambda s: A[s]) if below else None)
+            upper.append(min(above, key=lambda s: A[s]) if above else None)
+        b = B[-1] if len(B) else 0
+        below = A.index(b-1) if b > 0 else None
+        above = A.index(b+1) if b < len(A) else None
+        known = min(i for i in (below, above, len(A)) if i is not None)
+        prefixes.append((A, lower, upper, below, above, known, index))
+    return prefixes
+
+
+def _forbidden_sites(P, prefix, mask, anywhere=False, work=None):
+    """Returns a bitmask containing the sites i such that appending the
+    value i to `P` creates an occurrence of the basis element described by
+    `prefix` (see `_basis_prefixes`) which uses the last two entries. If
+    `anywhere` is true, occurrences need only use the new last entry, so the
+    result is exact without knowing the sites forbidden at the ancestors.
+    If `work` is given, its first item is increased by the number of entries
+    of `P` scanned during the search.
+
+    The occurrences of the prefix of the basis element ending at the last
+    entry of `P` (at any entry, with `anywhere`) are found once, by
+    backtracking from the right. Each of them forbids an interval of sites:
+    those lying above the image of the value just below the last entry of
+    the basis element, and at most the image of the value just above it.
+    Partial occurrences are abandoned as soon as their interval is known
+    and holds no site of `mask` left to forbid, and the search stops when
+    every site of `mask` is forbidden.
+    """
+    (A, lower, upper, below, above, known, index) = prefix
+    n = len(P)
+    m = len(A)
+    if m == 0:
+        return mask
+    if m > n:
+        return 0
+    positions = [0]*m
+    forbidden = [0]
+
+    def extend(t, limit):
+        if t < 0 or t == known - 1:
+            lo = P[positions[below]] if below is not None else -1
+            hi = P[positions[above]] if above is not None else n
+            interval = ((1 << (hi+1)) - 1) & ~((1 << (lo+1)) - 1)
+            if not interval & mask & ~forbidden[0]:
+                return False
+            if t < 0:
+                forbidden[0] |= interval
+                return forbidden[0] & mask == mask
+        lo = P[positions[lower[t]]] if lower[t] is not None else -1
+        hi = P[positions[upper[t]]] if upper[t] is not None else n
+        if work is not None:
+            work[0] += limit - t
+        for j in range(limit-1, t-1, -1):
+            if lo < P[j] < hi:
+                positions[t] = j
+                if extend(t-1, j):
+                    return True
+        return False
+
+    for end in range(n-1, m-2 if anywhere else n-2, -1):
+        positions[m-1] = end
+        if extend(m-2, end):
+            break
+    return forbidden[0]
+
+
+def _forbidden_mask(P, mask, prefixes, counters=None, anywhere=False,
+                    work=None):
+    """Returns the sites of `mask` which are forbidden for right extensions
+    of `P` (see `_forbidden_sites`) by one of the basis elements described by
+    `prefixes`. The elements are tried in order, each searching only for the
+    sites still allowed, and the search stops at the first element leaving
+    no site. If `counters` is given, `counters[i]` is a list [searches,
+    rejected sites] updated for the basis element with index i."""
+    forbidden = 0
+    for prefix in prefixes:
+        remaining = mask & ~forbidden
+        if not remaining:
+            break
+        found = _forbidden_sites(P, prefix, remaining, anywhere, work) & remaining
+        if counters is not None:
+            counter = counters[prefix[-1]]
+            counter[0] += 1
+            if found:
+                counter[1] += bin(found).count('1')
+        forbidden |= found
+    return forbidden
+
+
+def _reorder(prefixes, counters):
+    """Sorts `prefixes` in place by decreasing number of sites rejected per
+    search by their basis elements, so that the elements most likely to
+    leave no site are tried first."""
+    prefixes.sort(key=lambda prefix: -float(counters[prefix[-1]][1])
+                                     / max(counters[prefix[-1]][0], 1))
+
+
+def _right_children(P, mask, prefixes, work=None, counters=None):
+    """Returns the right extensions of `P` avoiding the basis described by
+    `prefixes`, as pairs (child, mask of its active sites). Bit i of `mask`
+    is set when the value i may be appended to `P`; only those extensions
+    are generated. Sites which lead to a basis element are switched off, and
+    are then off for every child as well: a child with last entry i inherits
+    the sites of `P` below i, site i twice (on either side of the new entry),
+    and the sites above i shifted up by one."""
+    forbidden = _forbidden_mask(P, mask, prefixes, counters, work=work)
+    return _children_from_mask(P, mask & ~forbidden)
+
+
+def _children_from_mask(P, mask):
+    children = []
+    remaining = mask
+    while remaining:
+        low = remaining & -remaining
+        remaining ^= low
+        i = low.bit_length() - 1
+        Q = tuple.__new__(Permutation, [v + (v >= i) for v in P] + [i])
+        children.append((Q, (mask & ((2 << i) - 1)) | ((mask >> i) << (i + 1))))
+    return children
+
+
+def _generating_basis(basis, direction):
+    """Returns the basis whose class is generated by right extensions when
+    the class of `basis` is grown in `direction`."""
+    return [symmetries.image(B, DIRECTIONS[direction][0]) for B in basis]
+
+
+def choose_direction(basis, length=DIRECTION_ESTIMATE_LENGTH, halve=False,
+                     map_back=True):
+    """Returns the direction in `DIRECTIONS` in which the class of
+    permutations avoiding `basis` is cheapest to grow. Each direction is
+    tried up to `length`, and its cost is the number of entries scanned by
+    the searches for forbidden sites (the number of active sites is the
+    same in every direction, since the levels have the same sizes), plus,
+    with `map_back`, `MAP_BACK_COST` times the number of entries of the
+    permutations mapped back to the class for every direction but 'right'.
+    With `halve`, the cost of a direction is halved when the complement of
+    its generating basis is itself, as in `AvClass.count`. Another direction
+    is only chosen over 'right' when it costs at most `DIRECTION_MARGIN`
+    times as much.
+
+    >>> choose_direction([Permutation(4123)])
+    'right'
+    >>> choose_direction([Permutation(1342)])
+    'right'
+    >>> choose_direction([Permutation(4312), Permutation(4321)], map_back=False)
+    'left'
+    """
+    costs = {}
+    for direction in ('right', 'left', 'top', 'bottom'):
+        generating = _generating_basis(basis, direction)
+        prefixes = _basis_prefixes(generating)
+        work = [0]
+        entries = 0
+        frontier = [(Permutation([1]), 0b11)]
+        for n in range(2, length+1):
+            frontier = [child for (P, mask) in frontier
+                        for child in _right_children(P, mask, prefixes, work)]
+            entries += n*len(frontier)
+        cost = work[0]
+        if map_back and direction != 'right':
+            cost += MAP_BACK_COST*entries
+        if halve and 2 in symmetries.set_symmetries(generating):
+            cost /= 2
+        costs[direction] = cost
+    direction = min(costs, key=costs.get)
+    if costs[direction] > DIRECTION_MARGIN*costs['right']:
+        return 'right'
+    return direction
+
+
+def _orbit_level(images, group, prefixes, counters=None):
+    """Returns the canonical representatives of the orbits of length n+1, the
+    sizes of these orbits and the list of their images with the bitmasks of
+    their active sites, given that list for the orbits of length n under the
+    symmetries in `group` (which must preserve the class).
+
+    Every permutation of length n+1 is a right extension of an image of a
+    permutation of length n, so extending `images` from their active sites
+    yields every image of every orbit of length n+1, with its own active
+    sites, without searching for occurrences anywhere. When the complement
+    (which maps right extensions to right extensions) is in `group`, only one
+    of each pair of images differing by the complement is kept. The children
+    are reduced to their canonical forms together, with NumPy.
+    """
+    symmetries._require_numpy()
+    children = []
+    masks = []
+    for (R, mask) in images:
+        for (Q, mask_Q) in _right_children(R, mask, prefixes, counters=counters):
+            children.append(Q)
+            masks.append(mask_Q)
+    if not children:
+        return ([], [], [])
+    n = len(children[0])
+    M = np.array(children, dtype=np.uint8).reshape(-1, n)
+    if 2 in group:
+        pairs = np.minimum(pack_array(M), pack_array((n - 1) - M))
+        (codes, first) = np.unique(pairs, return_index=True)
+        first.sort()
+        M = M[first]
+        first = first.tolist()
+        children = [children[i] for i in first]
+        masks = [masks[i] for i in first]
+    canonical = symmetries.canonical_array(M, group=group)
+    (codes, first) = np.unique(pack_array(canonical), return_index=True)
+    canonical = canonical[first]
+    return ([Permutation._from_standard(row) for row in canonical.tolist()],
+            symmetries.orbit_sizes(canonical, group).tolist(),
+            list(zip(children, masks)))
+
+
+# basis and statistic updates of the worker processes extending levels
+_worker_state = {}
+
+
+def _init_worker(basis, track_stats):
+    _worker_state['prefixes'] = _basis_prefixes(basis)
+    _worker_state['counters'] = [[0, 0] for B in basis]
+    _worker_state['updates'] = [INCREMENTAL_STATS[name][1] for name in track_stats]
+
+
+def _extend_chunk(args):
+    """Extends a chunk of parents of length `n`, given as triples (packed
+    code, mask of active sites, tracked statistics), and returns the
+    surviving children in the same form, with the basis counters of the
+    chunk."""
+    (parents, n) = args
+    prefixes = _worker_state['prefixes']
+    updates = _worker_state['updates']
+    counters = [[0, 0] for prefix in prefixes]
+    children = []
+    for (k, (code, mask, stats)) in enumerate(parents):
+        if k % REORDER_INTERVAL == 0:
+            _reorder(prefixes, _worker_state['counters'])
+        P = Permutation.unpack(code, n)
+        for (Q, mask_Q) in _right_children(P, mask, prefixes,
+                                           counters=counters):
+            if updates:
+                stats_Q = tuple(update(v, P, Q[-1]) for (update, v)
+                                in zip(updates, stats))
+            else:
+                stats_Q = ()
+            children.append((Q.pack(), mask_Q, stats_Q))
+    for (total, counter) in zip(_worker_state['counters'], counters):
+        total[0] += counter[0]
+        total[1] += counter[1]
+    return (children, counters)
+
+
+def _count_subtree(root, mask, prefixes, max_length, counts, counters=None):
+    """Adds to `counts` the number of permutations of each length in the
+    generating tree below `root` (included), visiting it depth-first and
+    keeping only the children of the permutations on the current path. With
+    `counters`, the basis elements are reordered as the tree is visited."""
+    counts[len(root)] += 1
+    if len(root) >= max_length:
+        return
+    stack = [iter(_right_children(root, mask, prefixes, counters=counters))]
+    visited = 0
+    while stack:
+        child = next(stack[-1], None)
+        if child is None:
+            stack.pop()
+            continue
+        (Q, mask_Q) = child
+        counts[len(Q)] += 1
+        if len(Q) < max_length:
+            visited += 1
+            if counters is not None and visited % REORDER_INTERVAL == 0:
+                _reorder(prefixes, counters)
+            stack.append(iter(_right_children(Q, mask_Q, prefixes,
+                                              counters=counters)))
+
+
+def _count_chunk(args):
+    """Counts the subtrees below a chunk of roots of length `n`, given as
+    pairs (packed code, mask of active sites)."""
+    (roots, n, max_length) = args
+    prefixes = _worker_state['prefixes']
+    counts = [0]*(max_length+1)
+    for (code, mask) in roots:
+        _count_subtree(Permutation.unpack(code, n), mask, prefixes, max_length,
+                       counts, _worker_state['counters'])
+    return counts
 
 
 class AvClass(permpy.permclass.PermClass):
@@ -14,7 +379,94 @@ class AvClass(permpy.permclass.PermClass):
     """
 
 
-    def __init__(self, basis, length=8, verbose=0):
+    def __init__(self, basis, length=8, verbose=0, track_stats=None,
+                 workers=None, symmetric=False, direction='right',
+                 checkpoint=None, checkpoint_interval=600, resume_from=None):
+        """Represents the class of permutations avoiding `basis` up to length
+        `length`. Levels are generated on first access (a level needs all
+        shorter levels), so construction is cheap; `iter_level` streams a
+        level without storing the levels in between.
+
+        Parameters
+        ----------
+        basis : list of Permutation-like objects
+        length : int
+            maximum length of the permutations to generate
+        verbose : int
+            print progress every `verbose` parents (0 for none)
+        track_stats : list of str (optional)
+            names of statistics from `INCREMENTAL_STATS` to maintain during
+            generation. Each generated permutation carries the tuple of their
+            values as `tracked_stats`, and their distributions are available
+            through `distribution` without a second pass over the class.
+        workers : int (optional)
+            number of processes extending each level. Parents are sent in
+            chunks as packed codes with their insertion locations, and the
+            surviving children are merged by the calling process.
+        symmetric : Boolean
+            keep only one permutation per orbit under the symmetries
+            preserving the basis (see `representatives`), and the images of
+            the orbits of the last length with their active sites, from
+            which the next length is grown (halved when the complement
+            preserves the basis). Full levels are expanded when they are
+            accessed. Statistics cannot be tracked, and `workers` is ignored.
+        direction : str
+            direction in which permutations are grown, one of `DIRECTIONS`,
+            or 'auto' to use `choose_direction` (for lengths of at least
+            `DIRECTION_CHOICE_LENGTH`) when the first level longer than the
+            basis elements is generated. The estimate grows the class in
+            every direction, and rarely finds one cheaper than 'right' (the
+            default). The levels are the same in every direction. Tracked statistics and orbit representatives are
+            defined for right extensions, so they require 'right'.
+        checkpoint : str (optional)
+            path of a file to which the generated levels are written (in the
+            format of `permpy.storage`) whenever a level is completed,
+            together with the frontier and its active sites. While a level is
+            extended in the calling process, the progress within the level is
+            also written every `checkpoint_interval` seconds.
+        resume_from : str (optional)
+            path of a checkpoint from which to continue the generation. It
+            must have been written for the same basis and tracked statistics;
+            its direction is kept.
+
+        While an enumeration cache is enabled (see `permpy.enumcache`), and
+        unless `symmetric`, `track_stats`, `checkpoint` or `resume_from` is
+        given, the levels are loaded from the cache when they are first
+        accessed (even if it was filled for a symmetry of the basis), and the
+        levels generated beyond them are written back to it once they are
+        all generated (only their counting sequence, if the cache does not
+        store levels).
+
+        >>> C = AvClass([132], 5, track_stats=['inversions'])
+        >>> C.distribution('inversions', 3) == {0: 1, 1: 1, 2: 2, 3: 1}
+        True
+
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), 'av321.perms')
+        >>> len(AvClass([321], 6, checkpoint=path)[5])
+        42
+        >>> C = AvClass([321], 8, resume_from=path)
+        >>> C._generated, len(C[8])
+        (5, 1430)
+
+        A generation killed in the middle of a level resumes from the parents
+        it had not extended yet:
+
+        >>> C = AvClass([1342], 7, checkpoint=path, checkpoint_interval=0)
+        >>> write = C._write_checkpoint
+        >>> def write_and_stop(partial=None, path=None):
+        ...     write(partial, path)
+        ...     if partial is not None and len(partial[2]) > 1000:
+        ...         raise RuntimeError('killed')
+        >>> C._write_checkpoint = write_and_stop
+        >>> C[7]
+        Traceback (most recent call last):
+        ...
+        RuntimeError: killed
+        >>> C = AvClass([1342], 7, resume_from=path)
+        >>> C._partial[0], [len(C[n]) for n in range(8)] == AvClass.count([1342], 7)
+        (7, True)
+        """
         list.__init__(self, [PermSet() for i in range(0, length+1)])
         self.length = length
 
@@ -23,62 +475,723 @@ class AvClass(permpy.permclass.PermClass):
             temp_basis.append(Permutation(P))
         basis = temp_basis
         self.basis = basis
+        self.workers = workers
+        self.verbose = verbose
+        self.symmetric = symmetric
+
+        self.track_stats = list(track_stats) if track_stats else []
+        for name in self.track_stats:
+            if name not in INCREMENTAL_STATS:
+                err = 'Statistic {} cannot be tracked incrementally'.format(name)
+                raise ValueError(err)
+        self._stat_distributions = [Counter() for i in range(0, length+1)]
+        if symmetric and self.track_stats:
+            err = 'Statistics cannot be tracked on orbit representatives'
+            raise ValueError(err)
+        if symmetric and (checkpoint or resume_from):
+            err = 'Orbit representatives cannot be checkpointed'
+            raise ValueError(err)
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        self.symmetry_group = symmetries.set_symmetries(basis) if symmetric else (0,)
+
+        if resume_from is not None:
+            from permpy import storage
+            meta = storage.read_header(resume_from).get('meta') or {}
+            direction = meta.get('direction', direction)
+        # whether the direction is still to be chosen (see `_settle_direction`)
+        self._choose_direction = (direction == 'auto' and not self.track_stats
+                                  and not symmetric
+                                  and length >= DIRECTION_CHOICE_LENGTH)
+        if direction == 'auto':
+            direction = 'right'
+        if direction not in DIRECTIONS:
+            err = 'Unknown direction {}'.format(direction)
+            raise ValueError(err)
+        if direction != 'right' and (self.track_stats or symmetric):
+            err = 'Tracked statistics and orbit representatives require right extensions'
+            raise ValueError(err)
+        self.direction = direction
+        self._generating_basis = _generating_basis(basis, direction)
+        self._prefixes = _basis_prefixes(self._generating_basis)
+        self._backward = DIRECTIONS[direction][1]
+        # searches and rejected sites of each basis element (see
+        # `basis_statistics`), by which the elements are reordered
+        self._counters = [[0, 0] for B in basis]
+        # canonical representatives of the generated orbits, with their sizes
+        self._orbits = [{} for i in range(0, length+1)]
 
         if length >= 1:
-                self[1].add(Permutation([1]));
-        for n in range(2,length+1):
-            k = 0
-            outof = len(self[n-1])
-            for P in self[n-1]:
-                k += 1
+            P = Permutation([1])
+            if self.track_stats:
+                P.tracked_stats = tuple(INCREMENTAL_STATS[name][0]
+                                        for name in self.track_stats)
+                self._stat_distributions[1][P.tracked_stats] += 1
+            list.__getitem__(self, 1).add(P)
+            self._orbits[1][P] = 1
+        # levels up to this length have been generated, and the members of
+        # the last one are mapped to the bitmasks of their active sites
+        self._generated = min(length, 1)
+        self._frontier = {P: 0b11} if length >= 1 else {}
+        self._orbits_generated = self._generated
+        # images of the orbits of the last generated length, with their
+        # active sites (only one of each complementary pair, if the
+        # complement preserves the basis)
+        self._orbit_images = [(P, 0b11)] if length >= 1 else []
+        # (length, parents done, children so far) of a level in progress
+        self._partial = None
+        if resume_from is not None:
+            self._resume(resume_from)
+        # the enumeration cache, and the last level of its file for this
+        # class (None until the file is looked up, on first access)
+        self._cache = None
+        self._cached_length = None
+        if (enumcache.is_enabled() and not symmetric and not self.track_stats
+                and checkpoint is None and resume_from is None):
+            self._cache = enumcache.active()
+
+    def _materialize(self, n):
+        """Generates the levels up to `n`, if they have not been already."""
+        if n <= self._generated:
+            return
+        if self._cache is not None and self._cached_length is None:
+            self._load_cached(n)
+            if n <= self._generated:
+                return
+        if self.symmetric:
+            for k in range(self._generated+1, n+1):
+                self._generate_orbits(k)
+                list.__getitem__(self, k).update(self._expand_orbits(k))
+            self._generated = n
+        else:
+            self._settle_direction(n)
+            self._extend_levels(self._generated+1, n, self.verbose, self.workers)
+            if self._cache is not None:
+                self._store_cached()
+
+    def _settle_direction(self, n):
+        """Chooses the direction of growth with `choose_direction`, if it was
+        'auto', before level `n` is generated from the frontier. The levels up
+        to the length of the basis elements are grown to the right; once they
+        are, the direction is chosen and the active sites of the last level
+        are recomputed in it."""
+        k = max([len(B) for B in self.basis] or [0])
+        if not self._choose_direction or n <= k:
+            return
+        self._extend_levels(self._generated+1, k, self.verbose, self.workers)
+        self._choose_direction = False
+        direction = choose_direction(self.basis)
+        if direction == self.direction:
+            return
+        self.direction = direction
+        self._generating_basis = _generating_basis(self.basis, direction)
+        self._prefixes = _basis_prefixes(self._generating_basis)
+        self._backward = DIRECTIONS[direction][1]
+        forward = DIRECTIONS[direction][0]
+        full = (1 << (self._generated+1)) - 1
+        self._frontier = {}
+        for P in list.__getitem__(self, self._generated):
+            Q = symmetries.image(P, forward)
+            self._frontier[Q] = full & ~_forbidden_mask(Q, full, self._prefixes,
+                                                        anywhere=True)
+
+    def _generate_orbits(self, n):
+        """Generates the orbit representatives up to length `n`."""
+        for k in range(self._orbits_generated+1, n+1):
+            (reps, sizes, images) = _orbit_level(self._orbit_images,
+                                                 self.symmetry_group, self._prefixes,
+                                                 self._counters)
+            _reorder(self._prefixes, self._counters)
+            self._orbits[k] = dict(zip(reps, sizes))
+            self._orbit_images = images
+            self._orbits_generated = k
+
+    def _expand_orbits(self, n):
+        """Yields the members of the orbits of length `n`."""
+        if n == self._orbits_generated:
+            for (P, mask) in self._orbit_images:
+                yield P
+            if 2 in self.symmetry_group:
+                for (P, mask) in self._orbit_images:
+                    Q = tuple.__new__(Permutation, [n-1-v for v in P])
+                    if Q != P:
+                        yield Q
+            return
+        for rep in self._orbits[n]:
+            images = set(symmetries.image(rep, k) for k in self.symmetry_group)
+            for P in images:
+                yield P
+
+    def representatives(self, n):
+        """Returns the permutations of length `n` in the class up to the
+        symmetries preserving the basis, as a dictionary mapping the canonical
+        representative of each orbit (see `symmetries.canonical_form`) to the
+        size of the orbit. With `symmetric`, only these are generated.
+
+        >>> C = AvClass([2413, 3142], 8, symmetric=True)
+        >>> reps = C.representatives(6)
+        >>> len(reps), sum(reps.values())
+        (68, 394)
+        >>> len(C[6])
+        394
+        """
+        if self.symmetric:
+            self._generate_orbits(n)
+            return dict(self._orbits[n])
+        group = symmetries.set_symmetries(self.basis)
+        reps = {}
+        for P in self[n]:
+            rep = symmetries.canonical_form(P, group)[0]
+            reps[rep] = reps.get(rep, 0) + 1
+        return reps
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            indices = range(*key.indices(list.__len__(self)))
+            if len(indices):
+                self._materialize(max(indices))
+        elif -list.__len__(self) <= key < list.__len__(self):
+            self._materialize(key % list.__len__(self))
+        return list.__getitem__(self, key)
+
+    def __iter__(self):
+        self._materialize(self.length)
+        return list.__iter__(self)
+
+    def __repr__(self):
+        self._materialize(self.length)
+        return list.__repr__(self)
+
+    def __reduce_ex__(self, protocol):
+        self._materialize(self.length)
+        return list.__reduce_ex__(self, protocol)
+
+    def iter_level(self, n):
+        """Yields the permutations of length `n` in the class. Levels which
+        have not been generated are not stored: their members are reached
+        depth-first from the longest generated level, keeping only the
+        children of the permutations on the current path.
+
+        >>> C = AvClass([321], 12)
+        >>> sum(1 for P in C.iter_level(9))
+        4862
+        """
+        if n > self._generated and self._cache is not None and self._cached_length is None:
+            self._load_cached(n)
+        if n <= self._generated:
+            for P in list.__getitem__(self, n):
+                yield P
+            return
+        if self.symmetric:
+            self._generate_orbits(n)
+            for P in self._expand_orbits(n):
+                yield P
+            return
+        self._settle_direction(n)
+        updates = [INCREMENTAL_STATS[name][1] for name in self.track_stats]
+        for (root, mask) in self._frontier.items():
+            stack = [(root, iter(_right_children(root, mask, self._prefixes,
+                                                 counters=self._counters)))]
+            while stack:
+                (P, children) = stack[-1]
+                child = next(children, None)
+                if child is None:
+                    stack.pop()
+                    continue
+                (Q, mask_Q) = child
+                if updates:
+                    Q.tracked_stats = tuple(update(v, P, Q[-1]) for (update, v)
+                                            in zip(updates, P.tracked_stats))
+                if len(Q) == n:
+                    yield symmetries.image(Q, self._backward) if self._backward else Q
+                else:
+                    stack.append((Q, iter(_right_children(Q, mask_Q, self._prefixes,
+                                                          counters=self._counters))))
+
+    def _extend_levels(self, start, stop, verbose=0, workers=None):
+        """Builds levels `start` through `stop`, with a process pool shared
+        by all levels if `workers` is more than 1."""
+        pool = None
+        if workers is not None and workers > 1 and start <= stop:
+            import multiprocessing
+            pool = multiprocessing.Pool(workers, _init_worker,
+                                        ([tuple(B) for B in self._generating_basis],
+                                         self.track_stats))
+        try:
+            for n in range(start, stop+1):
+                self._extend_level(n, verbose, pool, workers)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def _extend_level(self, n, verbose=0, pool=None, workers=None):
+        """Builds level `n` of the class from level `n-1` by right extensions,
+        pruning insertion locations which are known to lead to a basis
+        element."""
+        level = list.__getitem__(self, n)
+        frontier = {}
+        # parents still to be extended, with their active sites
+        parents = self._frontier
+        if self._partial is not None and self._partial[0] == n:
+            (n, parents, frontier) = self._partial
+            self._partial = None
+        if pool is not None and len(parents) >= PARALLEL_THRESHOLD:
+            self._extend_level_parallel(n, pool, workers, frontier, parents)
+        else:
+            updates = [INCREMENTAL_STATS[name][1] for name in self.track_stats]
+            items = list(parents.items())
+            outof = len(items)
+            written = time.time()
+            for (k, (P, mask)) in enumerate(items, 1):
                 if verbose > 0 and k % verbose == 0:
                     # print '\t\t\t\tRight Extensions:',k,'/',outof,'\t( length',n,')'
                     print('\t\t\t\tRight Extenstions: {}/{}\t( length {}'.format(
                                 k, outof, n))
-                insertion_locations = P.insertion_locations
-                add_this_time = []
-                for Q in P.right_extensions():
-                    is_good = True
-                    for B in basis:
-                        if B.involved_in(Q,last_require=2):
-                            is_good = False
-                            insertion_locations[Q[-1]] = 0
-                            # break
-                    if is_good:
-
-                        add_this_time.append(Q)
-                for Q in add_this_time:
-                    # print Q,'is good'
-                    # print '\tchanging IL from ',Q.insertion_locations,'to',(insertion_locations[:Q[-1]+1]+    insertion_locations[Q[-1]:])
-                    Q.insertion_locations = insertion_locations[:Q[-1]+1] + insertion_locations[Q[-1]:]
-                    self[n].add(Q)
-
-    def extend_to_length(self, l):
+                if k % REORDER_INTERVAL == 0:
+                    _reorder(self._prefixes, self._counters)
+                for (Q, mask_Q) in _right_children(P, mask, self._prefixes,
+                                                   counters=self._counters):
+                    if updates:
+                        Q.tracked_stats = tuple(update(v, P, Q[-1]) for (update, v)
+                                                in zip(updates, P.tracked_stats))
+                        self._stat_distributions[n][Q.tracked_stats] += 1
+                    frontier[Q] = mask_Q
+                if (self.checkpoint is not None and k < outof and
+                        time.time() - written >= self.checkpoint_interval):
+                    self._write_checkpoint((n, dict(items[k:]), frontier))
+                    written = time.time()
+        _reorder(self._prefixes, self._counters)
+        level.update(self._map_back(frontier))
+        self._frontier = frontier
+        self._generated = n
+        if self.checkpoint is not None:
+            self._write_checkpoint()
+
+    @staticmethod
+    def _frontier_arrays(frontier, n, track_stats):
+        """Returns the entries, masks and tracked statistics of the members of
+        a frontier dictionary of permutations of length `n` as arrays."""
+        entries = np.fromiter(itertools.chain.from_iterable(frontier), dtype=np.uint8,
+                              count=len(frontier)*n).reshape(len(frontier), n)
+        masks = np.fromiter(frontier.values(), dtype=np.uint64, count=len(frontier))
+        stats = np.array([P.tracked_stats for P in frontier] if track_stats else [],
+                         dtype=np.int64).reshape(len(frontier), len(track_stats))
+        return (entries, masks, stats)
+
+    def _frontier_from_arrays(self, entries, masks, stats):
+        # built as in `_children_from_mask`, without `Permutation.__init__`
+        members = [tuple.__new__(Permutation, row) for row in entries.tolist()]
+        if self.track_stats:
+            for (P, values) in zip(members, stats.tolist()):
+                P.tracked_stats = tuple(values)
+        return dict(zip(members, masks.tolist()))
+
+    def _write_checkpoint(self, partial=None, path=None):
+        """Writes the generated levels, the frontier with the active sites of
+        its members, and the distributions of the tracked statistics to
+        `path` (by default `self.checkpoint`). With `partial` (the length of a
+        level in progress, the parents of the frontier not extended yet, and
+        the children of the others), the progress within that level is
+        written too. The parents left are written themselves, so that the
+        order in which the frontier is stored does not matter.
+
+        When the permutations are grown to the right, the frontier is the last
+        level and is stored sorted, as that level. A level interrupted after
+        such a checkpoint resumes with the same members and statistics:
+
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), 'av1342.perms')
+        >>> C = AvClass([1342], 7, track_stats=['inversions'], checkpoint=path,
+        ...             checkpoint_interval=0)
+        >>> write = C._write_checkpoint
+        >>> def write_and_stop(partial=None, path=None):
+        ...     write(partial, path)
+        ...     if partial is not None and partial[0] == 7 and len(partial[1]) < 200:
+        ...         raise RuntimeError('killed')
+        >>> C._write_checkpoint = write_and_stop
+        >>> C[7]
+        Traceback (most recent call last):
+        ...
+        RuntimeError: killed
+        >>> C = AvClass([1342], 7, track_stats=['inversions'], resume_from=path)
+        >>> D = AvClass([1342], 7, track_stats=['inversions'])
+        >>> C._partial[0], set(C[7]) == set(D[7])
+        (7, True)
+        >>> C.distribution('inversions', 7) == D.distribution('inversions', 7)
+        True
+        """
+        from permpy import storage
+        n = self._generated
+        levels = dict((k, list.__getitem__(self, k)) for k in range(1, n+1))
+        arrays = {}
+        (arrays['frontier'], arrays['masks'], arrays['stats']) = \
+            self._frontier_arrays(self._frontier, n, self.track_stats)
+        if not self._backward and n >= 1:
+            # the frontier is then the last level, whose sorted rows are
+            # stored once, with the active sites in the same order (a level in
+            # progress records its parents left, not their positions)
+            order = np.lexsort(arrays['frontier'].T[::-1])
+            levels[n] = (arrays.pop('frontier')[order], 'entries')
+            arrays['masks'] = arrays['masks'][order]
+            arrays['stats'] = arrays['stats'][order]
+        meta = {'generated': n, 'direction': self.direction,
+                'generating': [list(map(int, B)) for B in self._generating_basis],
+                'backward': self._backward,
+                'track_stats': self.track_stats, 'counters': self._counters}
+        if partial is not None:
+            (length, parents, children) = partial
+            meta['partial'] = [length]
+            (arrays['partial'], arrays['partial_masks'], arrays['partial_stats']) = \
+                self._frontier_arrays(children, length, self.track_stats)
+            (arrays['parents'], arrays['parent_masks'], arrays['parent_stats']) = \
+                self._frontier_arrays(parents, length-1, self.track_stats)
+        last = n if partial is None else partial[0]
+        for k in range(1, last+1):
+            joint = self._stat_distributions[k]
+            arrays['distribution{}'.format(k)] = np.array(
+                [list(values) + [count] for (values, count) in joint.items()],
+                dtype=np.int64).reshape(len(joint), len(self.track_stats)+1)
+        # rows of entries are much faster to write and to read back than ranks
+        storage.write(path or self.checkpoint, levels, basis=self.basis, arrays=arrays,
+                      kind='PermClass', meta=meta, encoding='entries')
+
+    def _resume(self, path, length=None):
+        """Restores the state written by `_write_checkpoint` to `path`. The
+        file may have been written for an image of the basis under one of the
+        symmetries (as in the enumeration cache); the permutations are then
+        grown in the same space as they were when it was written. If `length`
+        is less than the last level written, only the levels up to `length`
+        are restored, and the active sites of the last one are recomputed."""
+        from permpy import storage
+        F = storage.PermFile(path, mmap=False)
+        meta = F.meta or {}
+        self._choose_direction = False
+        if 'generated' not in meta:
+            err = '{} is not a checkpoint of an avoidance class'.format(path)
+            raise ValueError(err)
+        generating = sorted(Permutation(B) for B in meta['generating'])
+        if generating != sorted(self._generating_basis):
+            images = [k for k in range(8) if generating ==
+                      sorted(symmetries.image(B, k) for B in self.basis)]
+            if not images:
+                err = 'The checkpoint was written for the basis {}'.format(F.basis)
+                raise ValueError(err)
+            k = images[0]
+            if k and self.track_stats:
+                err = 'Tracked statistics require right extensions'
+                raise ValueError(err)
+            self.direction = SYMMETRY_DIRECTIONS[k]
+            self._generating_basis = [symmetries.image(B, k) for B in self.basis]
+            self._prefixes = _basis_prefixes(self._generating_basis)
+            self._backward = symmetries.INVERSES[k]
+        if meta['track_stats'] != self.track_stats:
+            err = 'The checkpoint was written tracking {}'.format(meta['track_stats'])
+            raise ValueError(err)
+        n = meta['generated']
+        last = meta['partial'][0] if 'partial' in meta else n
+        if length is not None and length < last:
+            (n, last) = (min(n, length), length)
+        elif last > self.length:
+            self.extend_to_length(last)
+        for (B, counter) in zip(meta['generating'], meta['counters']):
+            self._counters[self._generating_basis.index(Permutation(B))] = list(counter)
+        _reorder(self._prefixes, self._counters)
+        # levels are stored as members of the class which wrote them
+        forward = symmetries.INVERSES[meta['backward']]
+        convert = meta['backward'] != self._backward
+        for k in range(1, n):
+            list.__getitem__(self, k).update(
+                self._map_back([symmetries.image(P, forward) for P in F[k]])
+                if convert else F[k])
+        if n < meta['generated']:
+            full = (1 << (n+1)) - 1
+            self._frontier = {}
+            for P in F[n]:
+                Q = symmetries.image(P, forward)
+                self._frontier[Q] = full & ~_forbidden_mask(Q, full, self._prefixes,
+                                                            anywhere=True)
+        else:
+            entries = F.arrays['frontier'] if 'frontier' in F.arrays else F[n].data
+            self._frontier = self._frontier_from_arrays(
+                                entries, F.arrays['masks'], F.arrays['stats'])
+        # the members of the last level keep their tracked statistics
+        list.__getitem__(self, n).update(self._map_back(self._frontier))
+        for k in range(1, last+1):
+            self._stat_distributions[k] = Counter(dict(
+                (tuple(row[:-1]), row[-1])
+                for row in F.arrays['distribution{}'.format(k)].tolist()))
+        self._generated = n
+        if 'partial' in meta and last == meta['partial'][0]:
+            self._partial = (last,
+                             self._frontier_from_arrays(F.arrays['parents'],
+                                                        F.arrays['parent_masks'],
+                                                        F.arrays['parent_stats']),
+                             self._frontier_from_arrays(F.arrays['partial'],
+                                                        F.arrays['partial_masks'],
+                                                        F.arrays['partial_stats']))
+
+    def _load_cached(self, n):
+        """Loads the levels up to `n` from the enumeration cache, if it holds
+        a file of levels of this class or one of its symmetries."""
+        self._cached_length = 0
+        if not self._cache.store_levels:
+            return
+        entry = self._cache.levels(self.basis)
+        if entry is not None:
+            (path, self._cached_length) = entry
+            self._resume(path, n)
+
+    def _store_cached(self):
+        """Records the generated levels in the enumeration cache, if they go
+        beyond its file, or only their counting sequence if the cache does
+        not store levels."""
+        n = self._generated
+        if n <= self._cached_length:
+            return
+        counts = [len(list.__getitem__(self, k)) for k in range(n+1)]
+        if self._cache.store_levels:
+            self._write_checkpoint(path=self._cache.levels_path(self.basis))
+            self._cache.record_levels(self.basis, n, counts)
+        else:
+            self._cache.store_sequence(self.basis, counts)
+        self._cached_length = n
+
+    def _map_back(self, perms):
+        """Maps generated permutations to the members of the class."""
+        if not self._backward:
+            return perms
+        perms = list(perms)
+        if not perms or not symmetries.np_imported:
+            return [symmetries.image(Q, self._backward) for Q in perms]
+        n = len(perms[0])
+        # entries are chained rather than converted one permutation at a time
+        M = np.fromiter(itertools.chain.from_iterable(perms), count=len(perms)*n,
+                        dtype=np.uint8 if n <= 256 else np.uint16).reshape(-1, n)
+        return [tuple.__new__(Permutation, row) for row in
+                symmetries.apply_symmetry(M, self._backward).tolist()]
+
+    def _extend_level_parallel(self, n, pool, workers, frontier, parents):
+        parents = [(P.pack(), mask, P.tracked_stats)
+                   for (P, mask) in parents.items()]
+        chunks = [(parents[i::4*workers], n-1) for i in range(4*workers)]
+        for (children, counters) in pool.imap_unordered(_extend_chunk, chunks):
+            for (total, counter) in zip(self._counters, counters):
+                total[0] += counter[0]
+                total[1] += counter[1]
+            for (code, mask, stats) in children:
+                Q = Permutation.unpack(code, n)
+                if self.track_stats:
+                    Q.tracked_stats = stats
+                    self._stat_distributions[n][stats] += 1
+                frontier[Q] = mask
+
+    def extend_to_length(self, l, workers=None, checkpoint=None):
+        """Extends the class up to length `l`. As in the constructor, the new
+        levels are generated when they are first accessed, and are written
+        to `checkpoint` if it is given."""
+        if checkpoint is not None:
+            self.checkpoint = checkpoint
         for i in range(self.length+1, l+1):
-            self.append(permset.PermSet())
+            self.append(PermSet())
+            self._stat_distributions.append(Counter())
+            self._orbits.append({})
+        if workers is not None:
+            self.workers = workers
         if (l <= self.length):
             return
-        old = self.length
         self.length = l
-        for n in range(old+1,l+1):
-            for P in self[n-1]:
-                insertion_locations = P.insertion_locations
-                add_this_time = []
-                for Q in P.right_extensions():
-                    is_good = True
-                    for B in self.basis:
-                        if B.involved_in(Q,last_require=2):
-                            is_good = False
-                            insertion_locations[Q[-1]] = 0
-                            # break
-                    if is_good:
-
-                        add_this_time.append(Q)
-                for Q in add_this_time:
-                    # print Q,'is good'
-                    # print '\tchanging IL from ',Q.insertion_locations,'to',(insertion_locations[:Q[-1]+1]+    insertion_locations[Q[-1]:])
-                    Q.insertion_locations = insertion_locations[:Q[-1]+1] + insertion_locations[Q[-1]:]
-                    self[n].add(Q)
+
+    def save(self, path):
+        """Saves the levels of the class to `path`, together with the frontier
+        from which longer levels are generated (as a checkpoint). The file
+        can also be read by `PermClass.load`."""
+        self._materialize(self.length)
+        self._write_checkpoint(path=path)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """Loads an avoidance class saved with `save`, or with
+        `PermClass.save` if the file records a basis. The levels are read
+        into PermSets, since they are extended, so `mmap` is not supported.
+
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), 'av2413.perms')
+        >>> AvClass([2413], 6).save(path)
+        >>> C = AvClass.load(path)
+        >>> C.basis, [len(C[n]) for n in range(7)]
+        ([2 4 1 3], [0, 1, 2, 6, 23, 103, 512])
+        >>> C.extend_to_length(7)
+        >>> len(C[7])
+        2740
+        """
+        from permpy import storage
+        if mmap:
+            err = 'The levels of an avoidance class cannot be memory-mapped'
+            raise ValueError(err)
+        F = storage.PermFile(path, mmap=False)
+        if F.basis is None:
+            err = '{} does not record a basis'.format(path)
+            raise ValueError(err)
+        meta = F.meta or {}
+        length = max(F.lengths + [1])
+        if 'generated' in meta:
+            return cls(F.basis, length, track_stats=meta['track_stats'],
+                       resume_from=path)
+        C = cls(F.basis, length, direction='right')
+        for n in F.lengths:
+            list.__getitem__(C, n).update(F[n])
+        # the active sites of the last level are found by searching anywhere
+        full = (1 << (length+1)) - 1
+        C._frontier = dict((P, full & ~_forbidden_mask(P, full, C._prefixes,
+                                                        anywhere=True))
+                           for P in list.__getitem__(C, length))
+        C._generated = length
+        return C
+
+    @classmethod
+    def count(cls, basis, max_length, workers=None, verbose=False,
+              direction='right'):
+        """Returns the counting sequence of the class of permutations
+        avoiding `basis`, as the list `[len(C[n]) for n in range(max_length+1)]`
+        for `C = AvClass(basis, max_length)`, without storing the levels.
+
+        The generating tree of right extensions is traversed depth-first, so
+        only the children of the permutations on the current path are kept in
+        memory. When the complement preserves the basis, it maps the subtree
+        below 1 2 onto the subtree below 2 1, so only the first is traversed
+        and counted twice. With `workers`, the tree is first expanded
+        breadth-first until there are enough subtrees to share between the
+        processes. If `verbose` is true, the number of nodes visited per
+        second is printed. The permutations are grown in `direction`, as in
+        the constructor; 'auto' takes the halving into account, and no cost
+        of mapping back to the class. While an enumeration cache is enabled
+        (see `permpy.enumcache`), known sequences are read from it and new
+        ones recorded in it.
+
+        >>> AvClass.count([231], 7)
+        [0, 1, 2, 5, 14, 42, 132, 429]
+        >>> AvClass.count([2413, 3142], 7)
+        [0, 1, 2, 6, 22, 90, 394, 1806]
+        """
+        original = basis = [Permutation(P) for P in basis]
+        counts = [0]*(max_length+1)
+        if max_length < 1:
+            return counts
+        cache = enumcache.active()
+        if cache is not None:
+            cached = cache.sequence(original, max_length)
+            if cached is not None:
+                return cached[:max_length+1]
+        if direction == 'auto':
+            if (max_length < DIRECTION_CHOICE_LENGTH
+                    or max_length <= max([len(B) for B in basis] or [0])):
+                direction = 'right'
+            else:
+                direction = choose_direction(basis, halve=True, map_back=False)
+        if direction not in DIRECTIONS:
+            err = 'Unknown direction {}'.format(direction)
+            raise ValueError(err)
+        basis = _generating_basis(basis, direction)
+        prefixes = _basis_prefixes(basis)
+        counters = [[0, 0] for B in basis]
+        t = time.time()
+        root = Permutation([1])
+        frontier = [(root, 0b11)]
+        n = 1
+        weight = 1
+        if max_length >= 2 and 2 in symmetries.set_symmetries(basis):
+            counts[1] = 1
+            frontier = [(Q, mask) for (Q, mask)
+                        in _right_children(root, 0b11, prefixes) if Q[0] == 0]
+            n = 2
+            weight = 2
+        # sizes of the levels of the traversed subtrees
+        sub = [0]*(max_length+1)
+        if workers is None or workers <= 1:
+            for (P, mask) in frontier:
+                _count_subtree(P, mask, prefixes, max_length, sub, counters)
+        else:
+            sub[n] = len(frontier)
+            while n < max_length and 0 < len(frontier) < 16*workers:
+                frontier = [child for (P, mask) in frontier
+                            for child in _right_children(P, mask, prefixes,
+                                                         counters=counters)]
+                n += 1
+                sub[n] = len(frontier)
+            if n < max_length and frontier:
+                import multiprocessing
+                roots = [(P.pack(), mask) for (P, mask) in frontier]
+                chunks = [(roots[i::4*workers], n, max_length)
+                          for i in range(4*workers)]
+                pool = multiprocessing.Pool(workers, _init_worker,
+                                            ([tuple(B) for B in basis], []))
+                try:
+                    for counted in pool.imap_unordered(_count_chunk, chunks):
+                        for k in range(n+1, max_length+1):
+                            sub[k] += counted[k]
+                finally:
+                    pool.close()
+                    pool.join()
+        for k in range(1, max_length+1):
+            if sub[k]:
+                counts[k] = weight*sub[k]
+        if verbose:
+            elapsed = time.time() - t
+            nodes = sum(sub)
+            print('{} nodes in {:.2f} seconds ({:.0f} nodes per second)'.format(
+                        nodes, elapsed, nodes / elapsed if elapsed else 0))
+            if workers is None or workers <= 1:
+                for (B, (searches, rejected)) in zip(original, counters):
+                    print('\t{}: {} sites rejected in {} searches'.format(
+                                B, rejected, searches))
+        if cache is not None:
+            cache.store_sequence(original, counts)
+        return counts
+
+    def basis_statistics(self):
+        """Returns, for each basis element, the number of searches for the
+        sites it forbids and the number of sites it rejected during the
+        generation so far, as a dictionary mapping the element to the pair.
+        A site is counted for the first element rejecting it; the elements
+        are tried in decreasing order of sites rejected per search, and the
+        search for a parent stops once it has no site left.
+
+        >>> C = AvClass([123, 2143], 6)
+        >>> len(C[6])
+        89
+        >>> stats = C.basis_statistics()
+        >>> stats[Permutation(123)][1] > stats[Permutation(2143)][1] > 0
+        True
+        """
+        return dict((B, tuple(counter))
+                    for (B, counter) in zip(self.basis, self._counters))
+
+    def distribution(self, stat=None, length=None):
+        """Returns the distribution of a tracked statistic over the
+        permutations of the given length, as a dictionary mapping each value to
+        the number of permutations attaining it. If `stat` is not given, the
+        joint distribution of all tracked statistics (as tuples ordered as in
+        `track_stats`) is returned.
+
+        >>> C = AvClass([123], 4, track_stats=['descents', 'last_entry'])
+        >>> sum(C.distribution('descents', 4).values()) == len(C[4])
+        True
+        """
+        if length is None:
+            length = self.length
+        self._materialize(length)
+        joint = self._stat_distributions[length]
+        if stat is None:
+            return Counter(joint)
+        if stat not in self.track_stats:
+            err = 'Statistic {} was not tracked during generation'.format(stat)
+            raise ValueError(err)
+        idx = self.track_stats.index(stat)
+        dist = Counter()
+        for (values, count) in joint.items():
+            dist[values[idx]] += count
+        return dist
 
     def right_juxtaposition(self, C, generate_perms=True):
         A = permset.PermSet()
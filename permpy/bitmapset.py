@@ -0,0 +1,203 @@
+"""Dense storage for sets of permutations of a single length.
+
+A `BitmapLevel` stores a set of permutations of length n as a bitmap with one
+bit per rank (see `Permutation.perm2ind`), so that a set containing a large
+fraction of S_n takes n!/8 bytes (about 60 MB for n = 12) instead of one
+Python object per member. Set algebra is performed with vectorized bit
+operations on the whole bitmap.
+
+>>> S = BitmapLevel.from_permset(PermSet.all(4).difference([Permutation(1234)]))
+>>> len(S), Permutation(1234) in S, Permutation(2143) in S
+(23, False, True)
+>>> len(BitmapLevel.full(4) - S)
+1
+>>> sorted(BitmapLevel.full(4) - S), sorted(BitmapLevel.full(3))[-1]
+([1 2 3 4], 3 2 1)
+"""
+
+from math import factorial
+
+try:
+    import numpy as np
+    np_imported = True
+except ImportError:
+    np_imported = False
+
+from permpy.permutation import Permutation
+from permpy.permset import PermSet
+
+
+if np_imported:
+    _POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(bits):
+    if hasattr(np, 'bitwise_count'):
+        return int(np.bitwise_count(bits).sum(dtype=np.int64))
+    return int(_POPCOUNT[bits].sum(dtype=np.int64))
+
+
+class BitmapLevel(object):
+    """Set of permutations of length `length`, stored as a bitmap indexed by
+    `Permutation.perm2ind`."""
+
+    def __init__(self, length, bits=None):
+        if not np_imported:
+            err = 'BitmapLevel requires numpy'
+            raise NotImplementedError(err)
+        self.length = length
+        self.size = factorial(length)
+        nbytes = (self.size + 7) // 8
+        if bits is None:
+            bits = np.zeros(nbytes, dtype=np.uint8)
+        elif len(bits) != nbytes:
+            err = 'Bitmap for length {} must have {} bytes'.format(length, nbytes)
+            raise ValueError(err)
+        self.bits = bits
+
+    @classmethod
+    def empty(cls, length):
+        return cls(length)
+
+    @classmethod
+    def full(cls, length):
+        """Returns the bitmap of all of S_n."""
+        level = cls(length)
+        level.bits[:] = 0xFF
+        level._clear_padding()
+        return level
+
+    @classmethod
+    def from_ranks(cls, ranks, length):
+        """Builds a bitmap from an iterable or array of ranks."""
+        level = cls(length)
+        ranks = np.asarray(ranks, dtype=np.int64)
+        if len(ranks):
+            if ranks.min() < 0 or ranks.max() >= level.size:
+                raise ValueError('rank out of range for length {}'.format(length))
+            np.bitwise_or.at(level.bits, ranks >> 3,
+                             (1 << (ranks & 7)).astype(np.uint8))
+        return level
+
+    @classmethod
+    def from_permset(cls, S, length=None):
+        """Builds a bitmap from the permutations of `S` of length `length`
+        (by default, the length of an arbitrary member of `S`)."""
+        if length is None:
+            if len(S) == 0:
+                err = 'length must be given for an empty set'
+                raise ValueError(err)
+            length = len(next(iter(S)))
+        return cls.from_ranks([P.perm2ind() for P in S if len(P) == length],
+                              length)
+
+    def _clear_padding(self):
+        extra = 8*len(self.bits) - self.size
+        if extra:
+            self.bits[-1] &= np.uint8(0xFF >> extra)
+
+    def ranks(self):
+        """Returns the sorted array of ranks of the members."""
+        flags = np.unpackbits(self.bits, bitorder='little')[:self.size]
+        return np.flatnonzero(flags)
+
+    def to_permset(self):
+        """Converts the bitmap back to a PermSet."""
+        return PermSet(self)
+
+    def __iter__(self):
+        for rank in self.ranks().tolist():
+            yield Permutation.ind2perm(rank, self.length)
+
+    def __len__(self):
+        return _popcount(self.bits)
+
+    def __contains__(self, P):
+        if len(P) != self.length:
+            return False
+        rank = Permutation(P).perm2ind()
+        return bool(self.bits[rank >> 3] & (1 << (rank & 7)))
+
+    def add(self, P):
+        if len(P) != self.length:
+            err = 'Cannot add a permutation of length {} to a bitmap of length {}'.format(
+                        len(P), self.length)
+            raise ValueError(err)
+        rank = Permutation(P).perm2ind()
+        self.bits[rank >> 3] |= np.uint8(1 << (rank & 7))
+
+    def discard(self, P):
+        if len(P) != self.length:
+            return
+        rank = Permutation(P).perm2ind()
+        self.bits[rank >> 3] &= np.uint8(0xFF ^ (1 << (rank & 7)))
+
+    def __repr__(self):
+        return 'Bitmap of {} permutations of length {}'.format(len(self),
+                                                               self.length)
+
+    def _check(self, other):
+        if not isinstance(other, BitmapLevel):
+            other = BitmapLevel.from_permset(other, self.length)
+        if other.length != self.length:
+            err = 'Cannot combine bitmaps of lengths {} and {}'.format(
+                        self.length, other.length)
+            raise ValueError(err)
+        return other
+
+    def __or__(self, other):
+        return BitmapLevel(self.length, self.bits | self._check(other).bits)
+
+    def __and__(self, other):
+        return BitmapLevel(self.length, self.bits & self._check(other).bits)
+
+    def __sub__(self, other):
+        return BitmapLevel(self.length, self.bits & ~self._check(other).bits)
+
+    def __xor__(self, other):
+        return BitmapLevel(self.length, self.bits ^ self._check(other).bits)
+
+    def __invert__(self):
+        """Returns the complement of the set inside S_n."""
+        level = BitmapLevel(self.length, ~self.bits)
+        level._clear_padding()
+        return level
+
+    def __ior__(self, other):
+        self.bits |= self._check(other).bits
+        return self
+
+    def __iand__(self, other):
+        self.bits &= self._check(other).bits
+        return self
+
+    def __isub__(self, other):
+        self.bits &= ~self._check(other).bits
+        return self
+
+    union = __or__
+    intersection = __and__
+    difference = __sub__
+    symmetric_difference = __xor__
+
+    def __eq__(self, other):
+        if not isinstance(other, BitmapLevel):
+            return NotImplemented
+        return self.length == other.length and np.array_equal(self.bits, other.bits)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def issubset(self, other):
+        other = self._check(other)
+        return not np.any(self.bits & ~other.bits)
+
+    def copy(self):
+        return BitmapLevel(self.length, self.bits.copy())
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
@@ -0,0 +1,394 @@
+"""Downsets of large sets of permutations.
+
+The downset is computed one length at a time, from the longest members down,
+on packed codes (see `Permutation.pack`, so only for lengths up to 16). Each
+layer of children is split into chunks processed by a pool of worker
+processes; every worker sends the codes of the children of its chunk back
+split into shards by a hash of the code, and each shard is then
+deduplicated by one worker. Only arrays of 64-bit codes cross process
+boundaries.
+
+With a memory budget, layers are computed out of core: children are
+buffered up to the budget, spilled to disk as sorted runs of codes, and the
+runs are deduplicated by a k-way merge into a file holding the level, which
+is then memory-mapped and streamed to produce the next layer.
+
+>>> S = PermSet([Permutation(2413), Permutation(321)])
+>>> levels = downset_levels(S, workers=2)
+>>> sorted((n, len(codes)) for (n, codes) in levels.items())
+[(0, 1), (1, 1), (2, 2), (3, 5), (4, 1)]
+>>> downset(S, workers=2) == S.downset()
+True
+"""
+
+import multiprocessing
+import heapq
+import os
+import pickle
+import shutil
+import tempfile
+
+try:
+    import numpy as np
+    np_imported = True
+except ImportError:
+    np_imported = False
+
+from permpy.permutation import Permutation
+from permpy.permset import PermSet
+from permpy.packedpermset import (MAX_LENGTH, pack_array, unpack_array,
+                                  children_codes)
+
+
+# layers with fewer members are handled in the calling process
+SERIAL_THRESHOLD = 1 << 12
+
+if np_imported:
+    _MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _require_numpy():
+    if not np_imported:
+        err = 'the downset engine requires numpy'
+        raise NotImplementedError(err)
+
+
+def codes_by_length(perms):
+    """Returns a dictionary mapping each length to the sorted array of
+    distinct codes of the permutations of that length in `perms`."""
+    _require_numpy()
+    groups = {}
+    for P in perms:
+        groups.setdefault(len(P), []).append(P)
+    levels = {}
+    for (n, group) in groups.items():
+        if n > MAX_LENGTH:
+            err = 'the downset engine only handles permutations of length at most {}'.format(MAX_LENGTH)
+            raise ValueError(err)
+        entries = np.array(group, dtype=np.uint8).reshape(-1, n)
+        levels[n] = np.unique(pack_array(entries))
+    return levels
+
+
+def permutations_from_codes(codes, n):
+    """Returns the list of permutations of length `n` with the given codes."""
+    return [Permutation._from_standard(row)
+            for row in unpack_array(codes, n).tolist()]
+
+
+def _shards(codes, count):
+    """Splits an array of codes into `count` arrays by a hash of the code."""
+    with np.errstate(over='ignore'):
+        which = ((codes * _MULTIPLIER) >> np.uint64(40)) % np.uint64(count)
+    order = np.argsort(which, kind='stable')
+    bounds = np.searchsorted(which[order], np.arange(1, count, dtype=np.uint64))
+    return np.split(codes[order], bounds)
+
+
+def _children_shards(args):
+    (codes, n, count) = args
+    return _shards(np.unique(children_codes(codes, n)), count)
+
+
+def _merge_shard(arrays):
+    return np.unique(np.concatenate(arrays))
+
+
+def layer_codes(codes, n, pool=None, shards=1, extra=None):
+    """Returns the distinct codes of the children of the permutations of
+    length `n` with the given codes, together with the codes in `extra`.
+    With a pool, the work is spread over `shards` shards."""
+    if pool is None or len(codes) < SERIAL_THRESHOLD:
+        children = children_codes(codes, n)
+        if extra is not None:
+            children = np.concatenate([children, extra])
+        return np.unique(children)
+    chunks = [chunk for chunk in np.array_split(codes, 4*shards) if len(chunk)]
+    parts = pool.map(_children_shards, [(chunk, n, shards) for chunk in chunks])
+    if extra is not None:
+        parts.append(_shards(extra, shards))
+    merged = pool.map(_merge_shard, [[part[s] for part in parts]
+                                     for s in range(shards)])
+    return np.concatenate(merged)
+
+
+def _pool(workers):
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers <= 1:
+        return (None, 1)
+    return (multiprocessing.Pool(workers), workers)
+
+
+def downset_levels(perms, workers=None, memory_budget=None, directory=None):
+    """Returns the downset of `perms` as a dictionary mapping each length
+    from 0 to the longest member to the array of distinct codes of that
+    length.
+
+    Parameters
+    ----------
+    perms : iterable of permutations of length at most 16, or a dictionary
+        mapping lengths to arrays of codes
+    workers : int (optional)
+        number of worker processes (by default, one per CPU); with 1, the
+        layers are computed in the calling process
+    memory_budget : int (optional)
+        approximate number of bytes of codes held in memory at once; if
+        given, layers are computed out of core and the returned arrays are
+        sorted and memory-mapped from temporary files
+    directory : str (optional)
+        where to create the temporary files (by default, the system
+        temporary directory)
+    """
+    _require_numpy()
+    levels = perms if isinstance(perms, dict) else codes_by_length(perms)
+    if not levels:
+        return {}
+    if memory_budget is not None:
+        return _external_downset_levels(levels, workers, memory_budget,
+                                        directory)
+    top = max(levels)
+    result = {top: np.unique(levels[top])}
+    (pool, shards) = _pool(workers)
+    try:
+        for n in range(top, 0, -1):
+            result[n-1] = layer_codes(result[n], n, pool, shards,
+                                      extra=levels.get(n-1))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return result
+
+
+def layer_down(perms, workers=None):
+    """Returns the PermSet of children of the members of `perms`, computed
+    with the downset engine."""
+    levels = codes_by_length(perms)
+    result = PermSet()
+    (pool, shards) = _pool(workers)
+    try:
+        for (n, codes) in levels.items():
+            if n > 0:
+                children = layer_codes(codes, n, pool, shards)
+                result.update(permutations_from_codes(children, n-1))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return result
+
+
+def downset(perms, workers=None, memory_budget=None, directory=None):
+    """Returns the downset of `perms` as a PermSet. See `downset_levels`."""
+    result = PermSet()
+    levels = downset_levels(perms, workers, memory_budget, directory)
+    for (n, codes) in levels.items():
+        result.update(permutations_from_codes(codes, n))
+    return result
+
+
+def merge_runs(paths, out_path, block=1 << 16):
+    """Merges files of sorted uint64 codes into a file of sorted distinct
+    codes, reading `block` codes of each run at a time. Returns the number
+    of codes written.
+
+    Each round, every run contributes its codes up to the smallest last
+    element of the current blocks, so the merged chunks are final and
+    disjoint from later ones.
+    """
+    runs = [np.memmap(path, dtype=np.uint64, mode='r') for path in paths
+            if os.path.getsize(path)]
+    positions = [0]*len(runs)
+    count = 0
+    with open(out_path, 'wb') as out:
+        while True:
+            active = [i for i in range(len(runs)) if positions[i] < len(runs[i])]
+            if not active:
+                break
+            chunks = dict((i, runs[i][positions[i]:positions[i]+block])
+                          for i in active)
+            bound = min(chunk[-1] for chunk in chunks.values())
+            parts = []
+            for (i, chunk) in chunks.items():
+                take = int(np.searchsorted(chunk, bound, side='right'))
+                parts.append(np.asarray(chunk[:take]))
+                positions[i] += take
+            merged = np.unique(np.concatenate(parts))
+            out.write(merged.tobytes())
+            count += len(merged)
+    del runs
+    return count
+
+
+class CodeRuns(object):
+    """Out-of-core deduplication of uint64 codes: codes are buffered up to
+    the memory budget, then written to disk as a sorted run; `finish` merges
+    the runs into one file of sorted distinct codes."""
+
+    def __init__(self, memory_budget, directory):
+        # sorting takes a second copy of the buffer
+        self.capacity = max(1 << 10, memory_budget // 16)
+        self.directory = directory
+        self.buffer = []
+        self.buffered = 0
+        self.runs = []
+
+    def add(self, codes):
+        self.buffer.append(np.asarray(codes, dtype=np.uint64))
+        self.buffered += len(codes)
+        if self.buffered >= self.capacity:
+            self._spill()
+
+    def _spill(self):
+        if not self.buffered:
+            return
+        run = np.unique(np.concatenate(self.buffer))
+        (fd, path) = tempfile.mkstemp(suffix='.run', dir=self.directory)
+        os.close(fd)
+        run.tofile(path)
+        self.runs.append(path)
+        self.buffer = []
+        self.buffered = 0
+
+    def finish(self, path):
+        """Writes the sorted distinct codes to `path` and returns their
+        number."""
+        if not self.runs:
+            codes = np.unique(np.concatenate(self.buffer)) if self.buffer \
+                        else np.zeros(0, dtype=np.uint64)
+            codes.tofile(path)
+            self.buffer = []
+            return len(codes)
+        self._spill()
+        count = merge_runs(self.runs, path,
+                           block=max(1 << 10, self.capacity // len(self.runs)))
+        for run in self.runs:
+            os.remove(run)
+        self.runs = []
+        return count
+
+
+def _open_level(path):
+    if not os.path.getsize(path):
+        return np.zeros(0, dtype=np.uint64)
+    return np.memmap(path, dtype=np.uint64, mode='r')
+
+
+def _external_downset_levels(levels, workers, memory_budget, directory):
+    tmp = tempfile.mkdtemp(prefix='downset', dir=directory)
+    top = max(levels)
+    path = os.path.join(tmp, 'level{}.codes'.format(top))
+    np.unique(levels[top]).tofile(path)
+    result = {top: _open_level(path)}
+    (pool, shards) = _pool(workers)
+    try:
+        for n in range(top, 0, -1):
+            runs = CodeRuns(memory_budget, tmp)
+            # each parent has n children
+            step = max(1, runs.capacity // (2*n))
+            current = result[n]
+            for start in range(0, len(current), step):
+                chunk = np.asarray(current[start:start+step])
+                runs.add(layer_codes(chunk, n, pool, shards))
+            if n-1 in levels:
+                runs.add(levels[n-1])
+            path = os.path.join(tmp, 'level{}.codes'.format(n-1))
+            runs.finish(path)
+            result[n-1] = _open_level(path)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        # mapped levels stay readable after their files are unlinked (where
+        # the platform does not allow this, the files are left behind)
+        shutil.rmtree(tmp, ignore_errors=True)
+    return result
+
+
+class SpilledLayer(object):
+    """Read-only set of objects stored on disk in sorted order, as written by
+    `ObjectRuns.finish`. It can be iterated over any number of times, and is
+    deleted by `close`."""
+
+    def __init__(self, path, count, decode=None):
+        self.path = path
+        self.count = count
+        self.decode = decode
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            while True:
+                try:
+                    chunk = pickle.load(f)
+                except EOFError:
+                    return
+                for item in chunk:
+                    yield item if self.decode is None else self.decode(item)
+
+    def close(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ObjectRuns(object):
+    """Out-of-core deduplication of orderable, picklable keys (for objects
+    which do not pack into 64 bits): distinct keys are buffered up to
+    `memory_budget` bytes (assuming `item_bytes` per key), spilled as sorted
+    pickled runs, and merged with `heapq.merge`."""
+
+    def __init__(self, memory_budget, directory=None, item_bytes=200):
+        self.capacity = max(1 << 10, memory_budget // item_bytes)
+        self.directory = directory
+        self.buffer = set()
+        self.runs = []
+
+    def add(self, key):
+        self.buffer.add(key)
+        if len(self.buffer) >= self.capacity:
+            self._spill()
+
+    def _write(self, items):
+        """Writes an iterable of items in pickled chunks to a new file and
+        returns its path and the number of items."""
+        (fd, path) = tempfile.mkstemp(suffix='.run', dir=self.directory)
+        count = 0
+        with os.fdopen(fd, 'wb') as f:
+            chunk = []
+            for item in items:
+                chunk.append(item)
+                if len(chunk) == 1 << 16:
+                    pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+                    count += len(chunk)
+                    chunk = []
+            if chunk:
+                pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+                count += len(chunk)
+        return (path, count)
+
+    def _spill(self):
+        if self.buffer:
+            self.runs.append(self._write(sorted(self.buffer))[0])
+            self.buffer = set()
+
+    def finish(self, decode=None):
+        """Merges the runs and returns the distinct keys as a SpilledLayer,
+        applying `decode` to each key when it is read."""
+        self._spill()
+        streams = [iter(SpilledLayer(path, 0)) for path in self.runs]
+        def distinct():
+            last = None
+            first = True
+            for key in heapq.merge(*streams):
+                if first or key != last:
+                    yield key
+                    last = key
+                    first = False
+        (path, count) = self._write(distinct())
+        for run in self.runs:
+            os.remove(run)
+        self.runs = []
+        return SpilledLayer(path, count, decode)
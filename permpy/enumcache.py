@@ -0,0 +1,318 @@
+"""Persistent cache of the enumerations of avoidance classes.
+
+Classes whose bases are images of each other under the symmetries of the
+square have the same counting sequence, and their levels are images of each
+other, so entries are keyed by the orbit of the basis (see
+`symmetries.set_orbit_key`), once it is reduced to its minimal elements. The
+cache is a SQLite database in a directory,
+recording for each key the longest counting sequence computed so far and,
+optionally, a file of levels written by `AvClass` in the format of
+`permpy.storage`, together with the frontier from which longer levels are
+generated. When the level files take more than `max_bytes`, the least
+recently used ones are evicted; counting sequences are small and kept. A
+cache created with `store_levels` false keeps only the sequences.
+
+While a cache is enabled with `enable`, `AvClass.count` answers from the
+stored sequences, and avoidance classes load their levels from the cache
+when they are first accessed, extending them (and the cached file) when a
+longer length is requested.
+
+Every sequence recorded in the cache is also indexed by its terms, so that
+`matches` finds the known bases whose counting sequences start with a given
+prefix, possibly with unknown terms, by intersecting sets in memory. This
+is how `misc.hunt_for_enumeration` starts from the bases found earlier.
+
+>>> import tempfile
+>>> from permpy.avclass import AvClass
+>>> cache = enable(tempfile.mkdtemp())
+>>> AvClass.count([231], 7)
+[0, 1, 2, 5, 14, 42, 132, 429]
+>>> cache.sequence([Permutation(132)])
+[0, 1, 2, 5, 14, 42, 132, 429]
+>>> len(AvClass([312], 6)[6]), len(AvClass([213], 8)[8])
+(132, 1430)
+>>> cache.levels([Permutation(231)])[1]
+8
+>>> cache.matches([1, 2, 5, None, 42])
+[[1 3 2]]
+>>> cache = enable(tempfile.mkdtemp(), store_levels=False)
+>>> len(AvClass([321], 7)[7])
+429
+>>> cache.sequence([Permutation(123)]), cache.levels([Permutation(123)])
+([0, 1, 2, 5, 14, 42, 132, 429], None)
+>>> disable()
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from permpy.permutation import Permutation
+from permpy.permset import PermSet
+from permpy import symmetries
+
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'permpy')
+DATABASE = 'enumerations.sqlite'
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS classes (
+    key TEXT PRIMARY KEY,
+    sequence TEXT NOT NULL,
+    levels TEXT,
+    length INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    used REAL NOT NULL)"""
+
+
+def basis_key(basis):
+    """Returns the key of the orbit of `basis` under the symmetries, as a
+    string. Duplicate elements, and elements containing others, are dropped
+    first, since they do not change the class.
+
+    >>> basis_key([231]) == basis_key([Permutation(132)])
+    True
+    >>> basis_key([123, 123]) == basis_key([123, 1234]) == basis_key([123])
+    True
+    """
+    minimal = PermSet(Permutation(B) for B in basis).minimal_elements()
+    key = symmetries.set_orbit_key(list(minimal))
+    return json.dumps([list(B) for B in key], separators=(',', ':'))
+
+
+def _decode_key(key):
+    return [Permutation._from_standard(B) for B in json.loads(key)]
+
+
+class EnumerationCache(object):
+    """Counting sequences and level files of avoidance classes stored in
+    `directory`, with hit and miss counters. If `store_levels` is false,
+    only the counting sequences are stored."""
+
+    def __init__(self, directory=None, max_bytes=1 << 30, store_levels=True):
+        self.directory = DEFAULT_DIRECTORY if directory is None else directory
+        self.max_bytes = max_bytes
+        self.store_levels = store_levels
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        # sets of keys indexed by the pairs (length, number of permutations)
+        # of their sequences, read from the database on first use
+        self._index = None
+        if not os.path.isdir(os.path.join(self.directory, 'levels')):
+            os.makedirs(os.path.join(self.directory, 'levels'))
+
+    @property
+    def db(self):
+        """The connection to the database, opened on first use."""
+        if self._db is None:
+            self._db = sqlite3.connect(os.path.join(self.directory, DATABASE),
+                                       timeout=60)
+            with self._db:
+                self._db.execute(SCHEMA)
+        return self._db
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_db'] = None
+        return state
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM classes').fetchone()[0]
+
+    def __repr__(self):
+        return 'Enumeration cache in {} with {} classes ({} bytes of levels)'.format(
+                    self.directory, len(self), self.size())
+
+    def _touch(self, key):
+        """Creates the entry of `key` if needed and marks it as used."""
+        self.db.execute('INSERT OR IGNORE INTO classes (key, sequence, used) '
+                        'VALUES (?, ?, ?)', (key, '[]', time.time()))
+        self.db.execute('UPDATE classes SET used = ? WHERE key = ?',
+                        (time.time(), key))
+
+    def sequence(self, basis, length=None):
+        """Returns the cached counting sequence of the class avoiding
+        `basis`, or None if it is unknown (or does not reach `length`)."""
+        row = self.db.execute('SELECT sequence FROM classes WHERE key = ?',
+                              (basis_key(basis),)).fetchone()
+        counts = json.loads(row[0]) if row is not None else []
+        if not counts or (length is not None and len(counts) <= length):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return counts
+
+    def store_sequence(self, basis, counts):
+        """Records the counting sequence `counts` of the class avoiding
+        `basis`, unless a longer one is already known."""
+        key = basis_key(basis)
+        with self.db:
+            self._touch(key)
+            row = self.db.execute('SELECT sequence FROM classes WHERE key = ?',
+                                  (key,)).fetchone()
+            if len(json.loads(row[0])) < len(counts):
+                self.db.execute('UPDATE classes SET sequence = ? WHERE key = ?',
+                                (json.dumps(list(counts)), key))
+                if self._index is not None:
+                    self._index_sequence(key, counts)
+
+    def _index_sequence(self, key, counts):
+        for (n, count) in enumerate(counts):
+            if n >= 1:
+                self._index.setdefault((n, count), set()).add(key)
+
+    def refresh(self):
+        """Forgets the index of sequences, so that the sequences recorded by
+        other processes are read on the next lookup."""
+        self._index = None
+
+    def matches(self, prefix):
+        """Returns the known bases (up to symmetry) of the classes whose
+        counting sequences start with `prefix`, where `prefix[i]` is the
+        number of permutations of length i+1, or None if it is unknown. Only
+        classes whose sequence is known up to the last given term are
+        returned, each by the smallest of its symmetric bases."""
+        if self._index is None:
+            self._index = {}
+            for (key, sequence) in self.db.execute('SELECT key, sequence FROM classes'):
+                self._index_sequence(key, json.loads(sequence))
+        terms = [(n, count) for (n, count) in enumerate(prefix, 1) if count is not None]
+        if not terms:
+            return [_decode_key(key) for key in sorted(self._all_keys())]
+        sets = sorted((self._index.get(term, set()) for term in terms), key=len)
+        keys = sets[0].intersection(*sets[1:])
+        return [_decode_key(key) for key in sorted(keys)]
+
+    def _all_keys(self):
+        return set(key for keys in self._index.values() for key in keys)
+
+    def levels(self, basis):
+        """Returns the path of the level file of the class avoiding `basis`
+        (or one of its symmetries) and the longest length it holds, or None
+        if there is no such file."""
+        key = basis_key(basis)
+        row = self.db.execute('SELECT levels, length FROM classes WHERE key = ?',
+                              (key,)).fetchone()
+        if row is None or row[0] is None or not os.path.exists(row[0]):
+            self.misses += 1
+            return None
+        self.hits += 1
+        with self.db:
+            self._touch(key)
+        return (row[0], row[1])
+
+    def levels_path(self, basis):
+        """Returns the path to which the levels of the class avoiding `basis`
+        are written."""
+        digest = hashlib.sha1(basis_key(basis).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, 'levels', digest[:20] + '.perms')
+
+    def record_levels(self, basis, length, counts):
+        """Records that the level file of the class avoiding `basis` holds
+        the levels up to `length`, with sizes `counts`, and evicts other
+        level files if the cache has grown too large."""
+        key = basis_key(basis)
+        path = self.levels_path(basis)
+        with self.db:
+            self._touch(key)
+            self.db.execute('UPDATE classes SET levels = ?, length = ?, bytes = ? '
+                            'WHERE key = ?',
+                            (path, length, os.path.getsize(path), key))
+        self.store_sequence(basis, counts)
+        self.evict(keep=key)
+
+    def size(self):
+        """Returns the total size of the level files, in bytes."""
+        return self.db.execute('SELECT COALESCE(SUM(bytes), 0) FROM classes').fetchone()[0]
+
+    def evict(self, keep=None):
+        """Deletes level files, least recently used first, until they take
+        at most `max_bytes`. The file of the key `keep` is not deleted."""
+        total = self.size()
+        if total <= self.max_bytes:
+            return
+        rows = self.db.execute('SELECT key, levels, bytes FROM classes '
+                               'WHERE levels IS NOT NULL ORDER BY used').fetchall()
+        with self.db:
+            for (key, path, size) in rows:
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                if os.path.exists(path):
+                    os.remove(path)
+                self.db.execute('UPDATE classes SET levels = NULL, length = 0, '
+                                'bytes = 0 WHERE key = ?', (key,))
+                total -= size
+
+    def hit_rate(self):
+        """Returns the fraction of lookups answered from the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def info(self):
+        """Returns a dictionary of counters describing the cache."""
+        files = self.db.execute('SELECT COUNT(*) FROM classes '
+                                'WHERE levels IS NOT NULL').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hit_rate(), 'classes': len(self),
+                'level_files': files, 'bytes': self.size(),
+                'max_bytes': self.max_bytes}
+
+    def clear(self):
+        """Removes all cached sequences and level files and resets the
+        counters."""
+        with self.db:
+            for (path,) in self.db.execute('SELECT levels FROM classes '
+                                           'WHERE levels IS NOT NULL').fetchall():
+                if os.path.exists(path):
+                    os.remove(path)
+            self.db.execute('DELETE FROM classes')
+        self._index = None
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+# the cache used by `AvClass` while enabled
+_active = None
+
+
+def enable(directory=None, max_bytes=None, cache=None, store_levels=None):
+    """Makes `AvClass` read from and write to `cache`, or to a new cache in
+    `directory` (by default `DEFAULT_DIRECTORY`) holding level files of at
+    most `max_bytes` bytes in total, or only counting sequences if
+    `store_levels` is false. Returns the cache."""
+    global _active
+    if cache is None:
+        cache = EnumerationCache(directory)
+    if max_bytes is not None:
+        cache.max_bytes = max_bytes
+    if store_levels is not None:
+        cache.store_levels = store_levels
+    disable()
+    _active = cache
+    return cache
+
+
+def disable():
+    """Stops `AvClass` from using the cache."""
+    global _active
+    if _active is not None:
+        _active.close()
+    _active = None
+
+
+def active():
+    """Returns the enabled cache, or None."""
+    return _active
+
+
+def is_enabled():
+    return _active is not None
@@ -6,6 +6,8 @@ from math import factorial
 import itertools
 from collections import Counter
 from permpy.RestrictedContainer import *
+from permpy import symmetries
+from permpy import enumcache
 
 
 def greedy_sum(p):
@@ -507,6 +509,16 @@ def kill_syms(bases):
   if len(bases) == 0:
     return bases
   bases = list(bases)
+  if symmetries.np_imported:
+    # keep the first basis of each orbit, identified by its batch orbit key
+    seen = set()
+    new_bases = []
+    for B in bases:
+      key = symmetries.set_orbit_key(B)
+      if key not in seen:
+        seen.add(key)
+        new_bases.append(PermSet(B))
+    return new_bases
   new_bases = [PermSet(bases[0])]
 
   for B in bases[1:]:
@@ -537,9 +549,27 @@ def kill_auts(basis_so_far, additions):
   
 
 
-def hunt_for_enumeration(enum, max_len = 8, check_ahead = 2, verbose = False):
+def hunt_for_enumeration(enum, max_len = 8, check_ahead = 2, verbose = False, max_basis_size = None):
   bases = [[]]
   done_bases = []
+  done_keys = set()
+  # with an enumeration cache enabled, bases enumerated far enough before are
+  # matched from its index and not searched again, and candidates whose
+  # cached sequences are too small are dropped without building their classes
+  cache = enumcache.active()
+  if cache is not None and len(enum) >= max_len+check_ahead:
+    for B in cache.matches(enum[:max_len+check_ahead]):
+      # only bases the search below could find: antichains of permutations
+      # of length at most max_len, with at most max_basis_size elements
+      if len(PermSet(B).minimal_elements()) < len(B):
+        continue
+      if max([len(b) for b in B] + [0]) > max_len:
+        continue
+      if max_basis_size is not None and len(B) > max_basis_size:
+        continue
+      print("\tKnown match: ",B)
+      done_bases.append(B)
+      done_keys.add(enumcache.basis_key(B))
   # on_length = 1
   
   while len(bases) > 0:
@@ -562,17 +592,23 @@ def hunt_for_enumeration(enum, max_len = 8, check_ahead = 2, verbose = False):
       C.extend_to_length(max_len+check_ahead)
       if all([len(C[i]) == enum[i-1] for i in range(1, len(C))]):
         print("\tPerfect match!")
-        done_bases.append(B)
+        if cache is None or enumcache.basis_key(B) not in done_keys:
+          done_bases.append(B)
     else:
       first_diff = min(diffs)
       if len(C[first_diff]) <= enum[first_diff-1]:
         if verbose:
           print("\tNo chance.");
         continue
+      if max_basis_size is not None and len(B) >= max_basis_size:
+        if verbose:
+          print("\tBasis is full.")
+        continue
       if verbose:
         print("\tCurrent Enum:",[len(C[i]) for i in range(1,len(C))])
       if len(B) == 0:
-        to_try = sorted([P for P in C[first_diff] if P.is_representative()])
+        index = symmetries.OrbitIndex(C[first_diff])
+        to_try = sorted([P for P in C[first_diff] if index.is_representative(P)])
       elif max([len(b) for b in B]) < first_diff:
         # try all basis elements in lex order
         to_try = sorted(list(C[first_diff]))
@@ -593,14 +629,22 @@ def hunt_for_enumeration(enum, max_len = 8, check_ahead = 2, verbose = False):
       for new_b in to_try:
         ci += 1
         new_B = PermSet(B).union(PermSet([new_b]))
+        if cache is not None and enumcache.basis_key(new_B) in done_keys:
+          # a known match: reported already, and any larger basis is too small
+          continue
         if verbose:
           print("\t\tTrying basis:",sorted(list(new_B)),"\t(",ci,"/",k,")")
         elif ci % 25 == 0:
           print("\t(",ci,"/",k,")")
-        new_C = AvClass(new_B, first_diff+check_ahead)
-        if all([len(new_C[i]) >= enum[i-1] for i in range(first_diff+1, first_diff+check_ahead+1)]):
+        counts = None
+        if cache is not None:
+          counts = cache.sequence(new_B, first_diff+check_ahead)
+        if counts is None:
+          new_C = AvClass(new_B, first_diff+check_ahead)
+          counts = [len(new_C[i]) for i in range(len(new_C))]
+        if all([counts[i] >= enum[i-1] for i in range(first_diff+1, first_diff+check_ahead+1)]):
           if verbose:
-            print("\t\t\tOkay. New enum:",[len(new_C[i]) for i in range(1,len(new_C))])
+            print("\t\t\tOkay. New enum:",counts[1:first_diff+check_ahead+1])
           
             # print("\t\t\t\tMatches check_ahead: checking all the way.")
             # new_C.extend_to_length(max_len+check_ahead)
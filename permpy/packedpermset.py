@@ -0,0 +1,352 @@
+"""Compact hash set for permutations of length at most 16.
+
+Each permutation is encoded as a 64-bit integer with 4 bits per entry (the
+code of `Permutation.pack`), and the codes of each length are kept in an
+open-addressing table stored in a NumPy array. A member costs 16 bytes at
+most, instead of a full `Permutation` object, and `Permutation` objects are
+only created when the set is iterated over. Membership tests, set algebra and
+`layer_down` work on whole arrays of codes at once.
+
+>>> S = PackedPermSet(PermSet.all(4))
+>>> len(S), Permutation(2413) in S, Permutation(123) in S
+(24, True, False)
+>>> S = PackedPermSet([Permutation(2413)]).downset()
+>>> S == PermSet([Permutation(2413)]).downset()
+True
+"""
+
+from collections.abc import MutableSet
+
+try:
+    import numpy as np
+    np_imported = True
+except ImportError:
+    np_imported = False
+
+from permpy.permutation import Permutation
+from permpy.permset import PermSet
+
+
+MAX_LENGTH = 16
+
+if np_imported:
+    # no permutation of length at most 16 has this code (all entries 15)
+    _EMPTY = np.uint64(0xFFFFFFFFFFFFFFFF)
+    _MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def pack_array(entries):
+    """Packs a (m, n) array of permutations of length n <= 16 into an array of
+    m codes, matching `Permutation.pack`."""
+    entries = np.asarray(entries, dtype=np.uint64)
+    m, n = entries.shape
+    codes = np.zeros(m, dtype=np.uint64)
+    for i in range(n):
+        codes <<= np.uint64(4)
+        codes |= entries[:, i]
+    return codes
+
+
+def unpack_array(codes, n):
+    """Unpacks an array of codes of permutations of length n into a (m, n)
+    array of entries."""
+    codes = np.asarray(codes, dtype=np.uint64)
+    entries = np.empty((len(codes), n), dtype=np.uint8)
+    for i in range(n):
+        shift = np.uint64(4*(n-1-i))
+        entries[:, i] = (codes >> shift) & np.uint64(0xF)
+    return entries
+
+
+def children_codes(codes, n):
+    """Returns the (non-unique) codes of all permutations obtained by deleting
+    one entry from the permutations of length n with the given codes."""
+    entries = unpack_array(codes, n).astype(np.int16)
+    result = []
+    for i in range(n):
+        removed = entries[:, i:i+1]
+        child = np.delete(entries, i, axis=1)
+        child -= (child > removed)
+        result.append(pack_array(child))
+    if not result:
+        return np.zeros(0, dtype=np.uint64)
+    return np.concatenate(result)
+
+
+class _CodeTable(object):
+    """Open-addressing (linear probing) hash table of uint64 codes."""
+
+    def __init__(self, capacity=8):
+        size = 8
+        while size < 2*capacity:
+            size *= 2
+        self.table = np.full(size, _EMPTY, dtype=np.uint64)
+        self.count = 0
+        self._set_shift()
+
+    def _set_shift(self):
+        self.mask = len(self.table) - 1
+        self.shift = np.uint64(64 - (len(self.table).bit_length() - 1))
+
+    def _home(self, codes):
+        with np.errstate(over='ignore'):
+            return ((codes * _MULTIPLIER) >> self.shift).astype(np.int64)
+
+    def codes(self):
+        return self.table[self.table != _EMPTY]
+
+    def contains(self, codes):
+        codes = np.asarray(codes, dtype=np.uint64)
+        found = np.zeros(len(codes), dtype=bool)
+        idx = self._home(codes)
+        pending = np.arange(len(codes))
+        while pending.size:
+            vals = self.table[idx[pending]]
+            hit = vals == codes[pending]
+            found[pending[hit]] = True
+            pending = pending[~(hit | (vals == _EMPTY))]
+            idx[pending] = (idx[pending] + 1) & self.mask
+        return found
+
+    def _grow(self, needed):
+        if 2*needed <= len(self.table):
+            return
+        old = self.codes()
+        size = len(self.table)
+        while size < 2*needed:
+            size *= 2
+        self.table = np.full(size, _EMPTY, dtype=np.uint64)
+        self.count = 0
+        self._set_shift()
+        self._place(old)
+
+    def _place(self, codes):
+        """Stores codes known to be distinct and absent from the table."""
+        idx = self._home(codes)
+        pending = np.arange(len(codes))
+        while pending.size:
+            slots = idx[pending]
+            free = self.table[slots] == _EMPTY
+            # several codes may probe the same free slot: the first one wins
+            free_slots, first = np.unique(slots[free], return_index=True)
+            winners = pending[free][first]
+            self.table[free_slots] = codes[winners]
+            pending = np.setdiff1d(pending, winners, assume_unique=True)
+            idx[pending] = (idx[pending] + 1) & self.mask
+        self.count += len(codes)
+
+    def insert(self, codes):
+        codes = np.unique(np.asarray(codes, dtype=np.uint64))
+        codes = codes[~self.contains(codes)]
+        if len(codes):
+            self._grow(self.count + len(codes))
+            self._place(codes)
+
+    def remove(self, code):
+        """Removes a single code, shifting later entries of its probe run
+        back so that lookups stay correct."""
+        table = self.table
+        i = int(self._home(np.array([code], dtype=np.uint64))[0])
+        while table[i] != code:
+            if table[i] == _EMPTY:
+                return False
+            i = (i + 1) & self.mask
+        j = i
+        while True:
+            j = (j + 1) & self.mask
+            if table[j] == _EMPTY:
+                break
+            home = int(self._home(table[j:j+1])[0])
+            # move table[j] into the hole at i unless its home lies in (i, j]
+            if (j > i and (home <= i or home > j)) or \
+                    (j < i and (home <= i and home > j)):
+                table[i] = table[j]
+                i = j
+        table[i] = _EMPTY
+        self.count -= 1
+        return True
+
+
+class PackedPermSet(MutableSet):
+    """Set of permutations of length at most 16, stored as packed 64-bit
+    codes in one hash table per length."""
+
+    def __init__(self, iterable=()):
+        if not np_imported:
+            err = 'PackedPermSet requires numpy'
+            raise NotImplementedError(err)
+        self._tables = {}
+        if isinstance(iterable, PackedPermSet):
+            for (n, table) in iterable._tables.items():
+                self.add_codes(table.codes(), n)
+        else:
+            self.update(iterable)
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        return cls(iterable)
+
+    @classmethod
+    def from_codes(cls, codes, n):
+        """Builds a set from an array of codes of permutations of length n."""
+        S = cls()
+        S.add_codes(codes, n)
+        return S
+
+    def add_codes(self, codes, n):
+        if n > MAX_LENGTH:
+            err = 'PackedPermSet only holds permutations of length at most {}'.format(MAX_LENGTH)
+            raise ValueError(err)
+        if len(codes) == 0:
+            return
+        if n not in self._tables:
+            self._tables[n] = _CodeTable(len(codes))
+        self._tables[n].insert(codes)
+
+    def codes(self, n):
+        """Returns the array of codes of the members of length n."""
+        if n not in self._tables:
+            return np.zeros(0, dtype=np.uint64)
+        return self._tables[n].codes()
+
+    def lengths(self):
+        """Returns the sorted list of lengths of the members."""
+        return sorted(n for (n, table) in self._tables.items() if table.count)
+
+    def __len__(self):
+        return sum(table.count for table in self._tables.values())
+
+    def __repr__(self):
+        return 'Packed set of {} permutations'.format(len(self))
+
+    def __contains__(self, P):
+        n = len(P)
+        if n not in self._tables:
+            return False
+        code = np.array([Permutation(P).pack()], dtype=np.uint64)
+        return bool(self._tables[n].contains(code)[0])
+
+    def __iter__(self):
+        for n in self.lengths():
+            codes = self._tables[n].codes()
+            for start in range(0, len(codes), 4096):
+                for row in unpack_array(codes[start:start+4096], n).tolist():
+                    yield Permutation._from_standard(row)
+
+    def add(self, P):
+        self.add_codes([Permutation(P).pack()], len(P))
+
+    def discard(self, P):
+        n = len(P)
+        if n in self._tables:
+            self._tables[n].remove(np.uint64(Permutation(P).pack()))
+
+    def update(self, *others):
+        for other in others:
+            if isinstance(other, PackedPermSet):
+                for n in other.lengths():
+                    self.add_codes(other.codes(n), n)
+                continue
+            groups = {}
+            for P in other:
+                groups.setdefault(len(P), []).append(Permutation(P).pack())
+            for (n, codes) in groups.items():
+                self.add_codes(np.array(codes, dtype=np.uint64), n)
+
+    def _coerce(self, other):
+        return other if isinstance(other, PackedPermSet) else PackedPermSet(other)
+
+    def union(self, *others):
+        result = PackedPermSet(self)
+        result.update(*others)
+        return result
+
+    def intersection(self, other):
+        other = self._coerce(other)
+        result = PackedPermSet()
+        for n in self.lengths():
+            if n in other._tables:
+                codes = self.codes(n)
+                result.add_codes(codes[other._tables[n].contains(codes)], n)
+        return result
+
+    def difference(self, other):
+        other = self._coerce(other)
+        result = PackedPermSet()
+        for n in self.lengths():
+            codes = self.codes(n)
+            if n in other._tables:
+                codes = codes[~other._tables[n].contains(codes)]
+            result.add_codes(codes, n)
+        return result
+
+    def symmetric_difference(self, other):
+        other = self._coerce(other)
+        return self.difference(other).union(other.difference(self))
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+    __xor__ = symmetric_difference
+
+    def issubset(self, other):
+        other = self._coerce(other)
+        for n in self.lengths():
+            if n not in other._tables or \
+                    not other._tables[n].contains(self.codes(n)).all():
+                return False
+        return True
+
+    def __le__(self, other):
+        return self.issubset(other)
+
+    def __eq__(self, other):
+        if not isinstance(other, (PackedPermSet, set, frozenset)):
+            return NotImplemented
+        return len(self) == len(other) and self.issubset(other)
+
+    __hash__ = None
+
+    def to_array(self, length):
+        """Returns the members of length `length` as a (m, n) uint8 array of
+        0-based entries, without creating Permutation objects."""
+        return unpack_array(self.codes(length), length)
+
+    def to_permset(self):
+        return PermSet(self)
+
+    def get_length(self, length):
+        return PackedPermSet.from_codes(self.codes(length), length)
+
+    def by_length(self):
+        return {n: self.get_length(n) for n in self.lengths()}
+
+    def layer_down(self):
+        """Returns the set of permutations obtained by deleting one entry from
+        a member of the set."""
+        S = PackedPermSet()
+        for n in self.lengths():
+            if n > 0:
+                S.add_codes(children_codes(self.codes(n), n), n-1)
+        return S
+
+    def downset(self, return_class=False):
+        """Returns the set of all patterns of members of the set, computed
+        one layer at a time on packed codes."""
+        done = PackedPermSet(self)
+        bottom_edge = PackedPermSet(self)
+        while len(bottom_edge) > 0:
+            next_layer = bottom_edge.layer_down().difference(done)
+            done.update(next_layer)
+            bottom_edge = next_layer
+        if not return_class:
+            return done
+        from permpy.permclass import PermClass
+        cl = [PackedPermSet()]
+        for i in range(1, max(done.lengths())+1):
+            cl.append(done.get_length(i))
+        return PermClass(cl)
+
+    @property
+    def nbytes(self):
+        return sum(table.table.nbytes for table in self._tables.values())
@@ -1,6 +1,8 @@
 from __future__ import print_function
 from .pegpermutation import *
 from .permset import *
+from .downsets import ObjectRuns, SpilledLayer
+from .storage import dump_checkpoint, load_checkpoint
 from itertools import chain, combinations, combinations_with_replacement
 from sympy import *
 import time, gc, sys
@@ -8,6 +10,13 @@ from sympy.core.cache import clear_cache
 import copy
 
 
+def _peg_key(P):
+  return (tuple(P), ''.join(P.signs))
+
+def _peg_from_key(key):
+  return PegPermutation(list(key[0]), key[1])
+
+
 class PegPermSet(PermSet):
 
   #===== Static Methods to build rearrangement generators =====#
@@ -273,7 +282,18 @@ class PegPermSet(PermSet):
 
   #   return (gf,unclean)
 
-  def alt_downset(self):
+  def alt_downset(self, memory_budget=None, directory=None, checkpoint=None,
+                  checkpoint_interval=600, resume_from=None):
+    """Returns the generating function of the clean members of the downset
+    and the dictionary of unclean members. If `memory_budget` (in bytes) is
+    given, each layer is deduplicated out of core and streamed from a file in
+    `directory` instead of being held in a PegPermSet.
+
+    If `checkpoint` is given, the generating function so far, the unclean
+    members and the current layer are written to that path before a layer
+    is shrunk, at most every `checkpoint_interval` seconds (see
+    `storage.dump_checkpoint`), and `resume_from` continues from such a file
+    instead of starting from this set."""
 
     topset = PegPermSet(self)
 
@@ -281,37 +301,64 @@ class PegPermSet(PermSet):
     keyssofar = PegPermSet()
     unclean = dict()
 
-    for PP in self:
-      if PP.is_compact() and not PP.is_compact_and_clean():
-        cleaned = PP.clean()
-        if cleaned in keyssofar:
-          unclean[cleaned].add(PP)
-        else:
-          unclean[cleaned] = PegPermSet([PP])
-          keyssofar.add(cleaned)
+    if resume_from is not None:
+      (state, items) = load_checkpoint(resume_from)
+      n = state['n']
+      gf = state['gf']
+      keyssofar.update(_peg_from_key(key) for key in state['keyssofar'])
+      for (key, members) in state['unclean'].items():
+        unclean[_peg_from_key(key)] = PegPermSet(_peg_from_key(M) for M in members)
+      if memory_budget is None:
+        bottom_edge.update(_peg_from_key(key) for key in items)
+      else:
+        runs = ObjectRuns(memory_budget, directory)
+        for key in items:
+          runs.add(key)
+        bottom_edge = runs.finish(decode=_peg_from_key)
+    else:
+      for PP in self:
+        if PP.is_compact() and not PP.is_compact_and_clean():
+          cleaned = PP.clean()
+          if cleaned in keyssofar:
+            unclean[cleaned].add(PP)
+          else:
+            unclean[cleaned] = PegPermSet([PP])
+            keyssofar.add(cleaned)
 
-    bottom_edge.update(self)
-    n = len(bottom_edge)
-    gf = self.sum_gfs_no_basis(bottom_edge, only_clean=True)
+      bottom_edge.update(self)
+      n = len(bottom_edge)
+      gf = self.sum_gfs_no_basis(bottom_edge, only_clean=True)
 
+    written = time.time()
     while len(bottom_edge) > 0:
+      if checkpoint is not None and time.time() - written >= checkpoint_interval:
+        state = {'n': n, 'gf': gf, 'keyssofar': [_peg_key(P) for P in keyssofar],
+                 'unclean': dict((_peg_key(P), [_peg_key(M) for M in members])
+                                 for (P, members) in unclean.items())}
+        dump_checkpoint(checkpoint, state, (_peg_key(P) for P in bottom_edge))
+        written = time.time()
       oldsize = n
       n = len(bottom_edge)
-      next_layer = PegPermSet()
 
-      i = 0
-      num_built = 0
-      t = time.time()
-      while len(bottom_edge) > 0:
-        i += 1
-        P = bottom_edge.pop()
-        next_layer.update(P.shrink_by_one())
-        del P
-        if i % 100000 == 0:
-          clear_cache()
-          print('\t',i,'of',n,'. Now with',len(next_layer),'. Took',(time.time()-t),'seconds.')
-          t = time.time()
+      if memory_budget is None:
+        next_layer = PegPermSet()
 
+        i = 0
+        num_built = 0
+        t = time.time()
+        while len(bottom_edge) > 0:
+          i += 1
+          P = bottom_edge.pop()
+          next_layer.update(P.shrink_by_one())
+          del P
+          if i % 100000 == 0:
+            clear_cache()
+            print('\t',i,'of',n,'. Now with',len(next_layer),'. Took',(time.time()-t),'seconds.')
+            t = time.time()
+      else:
+        next_layer = self._spilled_layer_down(bottom_edge, memory_budget, directory)
+        if isinstance(bottom_edge, SpilledLayer):
+          bottom_edge.close()
 
       del bottom_edge
       clear_cache()
@@ -354,8 +401,26 @@ class PegPermSet(PermSet):
       newsize = n
       print('\t\tDownset currently has',newsize,'permutations.')
 
+    if isinstance(bottom_edge, SpilledLayer):
+      bottom_edge.close()
     return (gf,unclean)
 
+  @staticmethod
+  def _spilled_layer_down(layer, memory_budget, directory=None):
+    """Returns the children of the members of `layer` as a SpilledLayer,
+    deduplicated by sorted runs on disk."""
+    runs = ObjectRuns(memory_budget, directory)
+    n = len(layer)
+    t = time.time()
+    for (i, P) in enumerate(layer, 1):
+      for Q in P.shrink_by_one():
+        runs.add(_peg_key(Q))
+      if i % 100000 == 0:
+        clear_cache()
+        print('\t',i,'of',n,'. Spilled',len(runs.runs),'runs. Took',(time.time()-t),'seconds.')
+        t = time.time()
+    return runs.finish(decode=_peg_from_key)
+
   def compactify(self):
     copy = PermSet(self)
     for P in copy:
@@ -4,6 +4,7 @@ from math import factorial
 
 import permpy.permutation
 from permpy.permset import PermSet
+from permpy.bitmapset import BitmapLevel, np_imported
 
 class PermClass(list):
 
@@ -61,11 +62,11 @@ class PermClass(list):
                 if not test(P):
                     self[i].remove(P)
 
-    def guess_basis(self, max_length=6, search_mode=False):
+    def guess_basis(self, max_length=6, search_mode=False, workers=None):
         """
-            Guess a basis for the class up to "max_length" by iteratively generating
-            the class with basis elements known so far ({}, to start with) and adding
-            elements which should be avoided to the basis.
+            Guess a basis for the class up to "max_length": the permutations
+            which are not in the class but all of whose children are (see
+            `basis_iter`).
 
             Search mode goes up to the max length in the class and prints out the number
             of basis elements of each length on the way.
@@ -78,40 +79,70 @@ class PermClass(list):
         if search_mode:
             max_length = len(self)-1
 
-        # Find the first length at which perms are missing.
-        not_all_perms = [i for i in range(len(self)) if i >= 1 and len(self[i]) != factorial(i)]
+        basis = PermSet()
+        for (length, elements) in self._basis_by_length(max_length, workers):
+            basis.update(elements)
 
-        # If no perms are missing, we have all perms, so return empty basis.
-        if len(not_all_perms) == 0:
-            return permset.PermSet([])
-
-        # Add missing perms of minimum length to basis.
-        start_length = min(not_all_perms)
-        basis = permset.PermSet(permutation.Permutation.listall(start_length)).difference(self[start_length])
-
-        if search_mode:
-            print('\t'+str(len(basis))+' basis elements of length '+str(start_length)+'\t\t'+("{0:.2f}".format(time.time() - t)) + ' seconds')
-            t = time.time()
-
-        basis_elements_so_far = len(basis)
-
-        current_length = start_length + 1
-
-        # Go up in length, adding missing perms at each step.
-        while current_length <= max_length:
-            C = avclass.AvClass(basis, current_length)
-            basis = basis.union(C[-1].difference(self[current_length]))
-
-            if search_mode:
-                print('\t'+str(len(basis)-basis_elements_so_far)+' basis elements of length ' + str(current_length) + '\t\t' + ("{0:.2f}".format(time.time() - t)) + ' seconds')
+            if search_mode and len(basis) > 0:
+                print('\t'+str(len(elements))+' basis elements of length ' + str(length) + '\t\t' + ("{0:.2f}".format(time.time() - t)) + ' seconds')
                 t = time.time()
 
-            basis_elements_so_far = len(basis)
-
-            current_length += 1
-
         return basis
 
+    def basis_iter(self, max_length=None, workers=None):
+        """Yields the basis elements of the class up to length `max_length`
+        (by default, the longest level), in order of length.
+
+        A permutation of length n is a basis element when it is not in the
+        class but all of its children are. Each basis element is an extension
+        of one of its children, so the candidates of length n are the
+        extensions of level n-1; each is checked against hashed levels, and
+        only kept when found from its smallest child, so that it is produced
+        once. The levels are scanned once per length, split between `workers`
+        processes if given.
+
+        >>> from permpy.permutation import Permutation
+        >>> C = PermSet([Permutation(2413), Permutation(3142)]).downset(return_class=True)
+        >>> sorted(C.basis_iter(4))
+        [1 2 3, 2 1 4 3, 3 2 1, 3 4 1 2]
+        """
+        if max_length is None:
+            max_length = len(self)-1
+        for (length, elements) in self._basis_by_length(max_length, workers):
+            for P in elements:
+                yield P
+
+    def _basis_by_length(self, max_length, workers=None):
+        """Yields, for each length up to `max_length`, the list of basis
+        elements of that length."""
+        for length in range(1, max_length+1):
+            # the empty permutation is in every nonempty class
+            lower = set([()]) if length == 1 else self[length-1]
+            upper = self[length]
+            if (np_imported and 1 < length <= 12 and
+                    len(lower) == factorial(length-1) and len(upper) < factorial(length)):
+                # all children of every permutation of this length are in the
+                # class, so the basis elements are the complement of the level
+                yield (length, sorted((~self.level_bitmap(length)).to_permset()))
+                continue
+            parents = list(lower)
+            if workers is None or workers <= 1 or len(parents) < 2*workers:
+                _init_basis(lower, upper)
+                found = _basis_candidates(parents)
+                _basis_state.clear()
+            else:
+                import multiprocessing
+                chunks = [parents[i::4*workers] for i in range(4*workers)]
+                levels = (frozenset(map(tuple, lower)), frozenset(map(tuple, upper)))
+                pool = multiprocessing.Pool(workers, _init_basis, levels)
+                try:
+                    found = [Q for chunk in pool.map(_basis_candidates, chunks)
+                             for Q in chunk]
+                finally:
+                    pool.close()
+                    pool.join()
+            yield (length, sorted(permpy.permutation.Permutation._from_standard(Q)
+                                  for Q in found))
 
     # def guess_basis(self, max_length=8):
     #       max_length = min(max_length, len(self)-1)
@@ -135,6 +166,43 @@ class PermClass(list):
     #               S = self.check_tree_basis(max_length, p, S)
     #           return S
 
+    def save(self, path):
+        """Saves the levels of the class (and its basis, if it has one) to
+        `path` in the binary format of `permpy.storage`."""
+        from permpy import storage
+        basis = getattr(self, 'basis', None)
+        levels = {n: self[n] for n in range(1, len(self))}
+        storage.write(path, levels, basis=basis, kind='PermClass')
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """Loads a class saved with `PermClass.save`. If `mmap` is true, the
+        levels are memory-mapped, read-only `permpy.storage.StoredLevel`
+        objects rather than PermSets. A stored basis is restored as the
+        `basis` attribute."""
+        from permpy import storage
+        F = storage.PermFile(path, mmap=mmap)
+        levels = [PermSet()]
+        for n in range(1, max(F.lengths + [0])+1):
+            if n not in F.levels:
+                levels.append(PermSet())
+            elif mmap:
+                levels.append(F[n])
+            else:
+                levels.append(F[n].to_permset())
+        # subclasses take other arguments (AvClass overrides this method)
+        C = cls.__new__(cls)
+        list.__init__(C, levels)
+        if F.basis is not None:
+            C.basis = F.basis
+        return C
+
+    def level_bitmap(self, length):
+        """Returns the permutations of the given length in the class as a
+        `BitmapLevel`, which supports fast set algebra against other levels
+        and against all of S_n (see `BitmapLevel.full`)."""
+        return BitmapLevel.from_permset(self[length], length)
+
     def plus_class(self,t):
         C = copy.deepcopy(self)
         for i in range(0,t):
@@ -159,3 +227,35 @@ class PermClass(list):
         return PermClass.class_from_test(lambda P : ((len(P) < len(self) and P in self[len(P)]) or P.sum_decomposable()) and all([Q in self[len(Q)] for Q in P.chom_sum()]), l=length, has_all_syms=has_syms)
 
 
+# levels n-1 and n of the class whose basis elements of length n are searched
+_basis_state = {}
+
+
+def _init_basis(lower, upper):
+    _basis_state['lower'] = lower
+    _basis_state['upper'] = upper
+
+
+def _basis_candidates(parents):
+    """Returns the basis elements (as tuples) which are extensions of the
+    permutations in `parents` and whose smallest child is that parent."""
+    lower = _basis_state['lower']
+    upper = _basis_state['upper']
+    found = set()
+    for P in parents:
+        P = tuple(P)
+        n = len(P) + 1
+        for v in range(n):
+            shifted = [w + (w >= v) for w in P]
+            for i in range(n):
+                Q = tuple(shifted[:i] + [v] + shifted[i:])
+                if Q in upper or Q in found:
+                    continue
+                for j in range(n):
+                    u = Q[j]
+                    child = tuple(w - (w > u) for w in Q[:j] + Q[j+1:])
+                    if child < P or child not in lower:
+                        break
+                else:
+                    found.add(Q)
+    return list(found)
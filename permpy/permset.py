@@ -1,9 +1,11 @@
 import random
 import fractions
+import itertools
 from functools import reduce
 
 import permpy.permutation
 from permpy.permutation import Permutation
+from permpy import symmetries
 # import permpy.permclass
 
 try:
@@ -13,6 +15,12 @@ try:
 except ImportError:
     mpl_imported = False
 
+try:
+    import numpy as np
+    np_imported = True
+except ImportError:
+    np_imported = False
+
 
 class PermSet(set):
     """Represents a set of permutations, and allows statistics to be computed
@@ -54,7 +62,9 @@ class PermSet(set):
         return PermSet(Permutation.listall(length))
 
     def get_random(self):
-        """Returns a random element from the set.
+        """Returns a random element from the set. The set is walked up to a
+        random position without being copied, which is still linear time; an
+        `IndexedPermSet` samples in constant time.
 
         Example
         -------
@@ -63,7 +73,9 @@ class PermSet(set):
         True
         """
 
-        return random.sample(self, 1)[0]
+        if not self:
+            raise IndexError('Cannot choose from an empty set')
+        return next(itertools.islice(self, random.randrange(len(self)), None))
 
 
     def get_length(self, length=None):
@@ -82,6 +94,32 @@ class PermSet(set):
         """
         return PermSet(p for p in self if len(p) == length)
 
+    def by_length(self):
+        """Returns a dictionary mapping each length present in the set to the
+        subset of permutations of that length, grouping them in one pass.
+
+        Example
+        -------
+        >>> S = PermSet.all(4) + PermSet.all(3)
+        >>> sorted((n, len(T)) for (n, T) in S.by_length().items())
+        [(3, 6), (4, 24)]
+        """
+        groups = {}
+        for perm in self:
+            n = len(perm)
+            if n in groups:
+                groups[n].add(perm)
+            else:
+                groups[n] = PermSet([perm])
+        return groups
+
+    def iter_by_length(self):
+        """Iterates over the set in order of increasing length."""
+        groups = self.by_length()
+        for n in sorted(groups):
+            for perm in groups[n]:
+                yield perm
+
     def heatmap(self, only_length=None, ax=None, blur=False, gray=False, **kwargs):
         """Visalization of a set of permutations, which, for each length, shows
         the relative frequency of each value in each position.
@@ -101,13 +139,7 @@ class PermSet(set):
             raise e(err)
         # first group permutations by length
         total_size = len(self)
-        perms_by_length = {}
-        for perm in self:
-            n = len(perm)
-            if n in perms_by_length:
-                perms_by_length[n].add(perm)
-            else:
-                perms_by_length[n] = PermSet([perm])
+        perms_by_length = self.by_length()
         # if given a length, ignore all other lengths
         if only_length:
             perms_by_length = {only_length: perms_by_length[only_length]}
@@ -171,6 +203,93 @@ class PermSet(set):
 
 
 
+    def save(self, path):
+        """Saves the set to `path` in the binary format of `permpy.storage`,
+        storing the permutations of each length as a sorted array."""
+        from permpy import storage
+        storage.save(path, self)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """Loads a set saved with `PermSet.save`. If `mmap` is true, the file
+        is memory-mapped instead and returned as a read-only
+        `permpy.storage.PermFile`, which opens instantly and tests membership
+        by binary search."""
+        from permpy import storage
+        F = storage.PermFile(path, mmap=mmap)
+        return F if mmap else cls(F)
+
+    @classmethod
+    def from_file(cls, path, base=None):
+        """Reads a (possibly gzipped) text file with one permutation per line,
+        given as space-separated entries or as a string of digits, 0- or
+        1-based. Lines are parsed in chunks with NumPy; see `permpy.textio`
+        for streaming files which are too large to hold as a set."""
+        from permpy import textio
+        return cls(textio.iter_permutations(path, base=base))
+
+    def to_file(self, path, base=1, digits=False):
+        """Writes the set to a text file, one permutation per line, grouped
+        by length. The file is gzipped if `path` ends in `.gz`."""
+        from permpy import textio
+        with textio.ArrayWriter(path, base=base, digits=digits) as writer:
+            writer.write_permutations(self)
+
+    def to_array(self, length=None):
+        """Returns the permutations as NumPy arrays of 0-based entries: a
+        dictionary mapping each length n to a contiguous (m, n) array (of type
+        uint8 for n up to 256), or only the array for `length` if it is given.
+
+        Example
+        -------
+        >>> PermSet([Permutation(231), Permutation(21)]).to_array(3).tolist()
+        [[1, 2, 0]]
+        """
+        if not np_imported:
+            err = 'to_array requires numpy'
+            raise NotImplementedError(err)
+        groups = {}
+        for P in self:
+            if length is None or len(P) == length:
+                groups.setdefault(len(P), []).append(P)
+        arrays = {}
+        for (n, group) in groups.items():
+            dtype = np.uint8 if n <= 256 else np.uint16
+            arrays[n] = np.array(group, dtype=dtype).reshape(-1, n)
+        if length is not None:
+            dtype = np.uint8 if length <= 256 else np.uint16
+            return arrays.get(length, np.zeros((0, length), dtype=dtype))
+        return arrays
+
+    @classmethod
+    def from_array(cls, M, check=True):
+        """Builds a set from a (m, n) array of 0-based entries, one
+        permutation per row (or from a dictionary of such arrays, as returned
+        by `to_array`). Rows are validated with one vectorized check unless
+        `check` is false, and are not standardized.
+
+        Example
+        -------
+        >>> S = PermSet.all(3)
+        >>> PermSet.from_array(S.to_array(3)) == S
+        True
+        """
+        if not np_imported:
+            err = 'from_array requires numpy'
+            raise NotImplementedError(err)
+        if isinstance(M, dict):
+            result = cls()
+            for A in M.values():
+                result.update(cls.from_array(A, check=check))
+            return result
+        M = np.asarray(M)
+        if check and M.size:
+            n = M.shape[1]
+            if (np.sort(M, axis=1) != np.arange(n)).any():
+                err = 'Every row must contain the integers 0 through {}'.format(n-1)
+                raise ValueError(err)
+        return cls(Permutation._from_standard(row) for row in M.tolist())
+
     def show_all(self):
         """The default representation doesn't print the entire set, this
         function does."""
@@ -182,33 +301,54 @@ class PermSet(set):
         result.update(other)
         return result
 
-    def minimal_elements(self):
+    def minimal_elements(self, workers=None):
         """Returns the elements of the set which are minimal with respect to
         the permutation pattern order.
 
+        Each element is tested by walking its downset from the top, through
+        the lengths between its own and the shortest length in the set, and
+        looking up each pattern in a hash index of the members of that length.
+        Whether the downset of a pattern meets the set is memoized, so patterns
+        shared by many elements are only explored once.
+
+        Parameters
+        ----------
+        workers : int (optional)
+            number of processes to split the elements between
+
         Examples
         --------
+        >>> S = PermSet([Permutation(123), Permutation(321), Permutation(1234),
+        ...              Permutation(2143), Permutation(3412)])
+        >>> sorted(S.minimal_elements())
+        [1 2 3, 2 1 4 3, 3 2 1, 3 4 1 2]
         """
-
-
-
-        B = list(self)
-        B = sorted(B, key=len)
-        C = B[:]
-        n = len(B)
-        for (i,b) in enumerate(B):
-            # if i % 1 == 0:
-                # print i,'/',n
-            if b not in C:
-                continue
-            for j in range(i+1,n):
-                if B[j] not in C:
-                    continue
-                if b.involved_in(B[j]):
-                    C.remove(B[j])
-        return PermSet(C)
+        if len(self) == 0:
+            return PermSet()
+        perms = list(self)
+        if workers is None or workers <= 1:
+            flags = _MinimalTester(perms).flags(perms)
+        else:
+            import multiprocessing
+            chunks = [perms[i::4*workers] for i in range(4*workers)]
+            pool = multiprocessing.Pool(workers, _init_minimal, (perms,))
+            try:
+                results = pool.map(_minimal_flags, chunks)
+            finally:
+                pool.close()
+                pool.join()
+            perms = [P for chunk in chunks for P in chunk]
+            flags = [flag for result in results for flag in result]
+        return PermSet(P for (P, flag) in zip(perms, flags) if flag)
 
     def all_syms(self):
+        if np_imported:
+            images = [[] for k in range(8)]
+            for M in self.to_array().values():
+                for (k, image) in enumerate(symmetries.all_symmetries(M)):
+                    images[k].extend(Permutation._from_standard(row)
+                                     for row in image.tolist())
+            return frozenset(frozenset(image) for image in images)
         sym_set = [frozenset(self)]
         sym_set.append(frozenset([i.reverse() for i in self]))
         sym_set.append(frozenset([i.complement() for i in self]))
@@ -216,7 +356,13 @@ class PermSet(set):
         sym_set.extend([frozenset([k.inverse() for k in L]) for L in sym_set])
         return frozenset(sym_set)
 
-    def layer_down(self):
+    def layer_down(self, workers=None):
+        """Returns the set of permutations obtained by deleting one entry from
+        a member of the set. If `workers` is given, the layer is computed on
+        packed codes by that many processes (see `permpy.downsets`)."""
+        if workers is not None:
+            from permpy import downsets
+            return downsets.layer_down(self, workers=workers)
         S = PermSet()
         i = 1
         n = len(self)
@@ -227,7 +373,62 @@ class PermSet(set):
             i += 1
         return S
 
-    def downset(self, return_class=False):
+    def downset(self, return_class=False, packed=False, workers=None,
+                memory_budget=None, directory=None):
+        """Returns the set of all permutations contained in some member of
+        the set.
+
+        Parameters
+        ----------
+        return_class : Boolean
+            return the result as a PermClass, split by length
+        packed : Boolean
+            compute on packed codes with a `PackedPermSet` (only for
+            permutations of length at most 16), and return packed sets
+        workers : int (optional)
+            compute each layer with that many processes, sharding the
+            children by hash (only for permutations of length at most 16;
+            see `permpy.downsets`)
+        memory_budget : int (optional)
+            compute the layers out of core, holding about that many bytes of
+            packed codes in memory and spilling sorted runs to temporary
+            files in `directory` (only for permutations of length at most
+            16; combine with `packed` to keep the result compact)
+        """
+        if workers is not None or memory_budget is not None:
+            from permpy import downsets
+            levels = downsets.downset_levels(self, workers=workers or 1,
+                                             memory_budget=memory_budget,
+                                             directory=directory)
+            if packed:
+                from permpy.packedpermset import PackedPermSet
+                groups = {n: PackedPermSet.from_codes(codes, n)
+                          for (n, codes) in levels.items()}
+                if not return_class:
+                    return PackedPermSet().union(*groups.values())
+                from permpy.permclass import PermClass
+                return PermClass([PackedPermSet()] + [groups[i]
+                                 for i in range(1, max(groups)+1)])
+            done = PermSet()
+            for (n, codes) in levels.items():
+                done.update(downsets.permutations_from_codes(codes, n))
+            if not return_class:
+                return done
+        elif packed:
+            from permpy.packedpermset import PackedPermSet
+            return PackedPermSet(self).downset(return_class=return_class)
+        else:
+            done = self._serial_downset()
+            if not return_class:
+                return done
+        from permpy.permclass import PermClass
+        groups = done.by_length()
+        cl = [PermSet([])]
+        for i in range(1,max(groups)+1):
+            cl.append(groups.get(i, PermSet()))
+        return PermClass(cl)
+
+    def _serial_downset(self):
         bottom_edge = PermSet()
         bottom_edge.update(self)
 
@@ -241,13 +442,7 @@ class PermSet(set):
             del next_layer
             newsize = len(done)
             # print '\t\tDownset currently has',newsize,'permutations, added',(newsize-oldsize),'in the last run.'
-        if not return_class:
-            return done
-        cl = [PermSet([])]
-        max_length = max([len(P) for P in done])
-        for i in range(1,max_length+1):
-            cl.append(PermSet([P for P in done if len(P) == i]))
-        return permclass.PermClass(cl)
+        return done
 
 
     def total_statistic(self, statistic):
@@ -285,3 +480,199 @@ class PermSet(set):
                             std = permpy.permutation.Permutation.standardize([p[i], p[j], p[k], p[m]])
                             patnums[''.join([str(x + 1) for x in std])] += 1
         return patnums
+
+
+class IndexedPermSet(PermSet):
+    """A PermSet which also keeps its members in per-length buckets and in an
+    indexable array. This makes `get_random` constant time, `get_length` and
+    `by_length` linear in the size of their result (they return copies of
+    the buckets, so that modifying them cannot desynchronise the index),
+    and gives iteration ordered by length, at the cost of some extra memory
+    and slower insertions and removals. Set operations which build a new set
+    (union, difference, ...) return ordinary sets.
+
+    Example
+    -------
+    >>> S = IndexedPermSet(PermSet.all(3) + PermSet.all(4))
+    >>> len(S.get_length(3)), S.get_random() in S
+    (6, True)
+    >>> S.discard(Permutation(123)); len(S.get_length(3))
+    5
+    """
+
+    def __init__(self, iterable=()):
+        set.__init__(self)
+        self._items = []
+        self._positions = {}
+        self._buckets = {}
+        self.update(iterable)
+
+    def __reduce__(self):
+        return (self.__class__, (list(self._items),))
+
+    def copy(self):
+        return self.__class__(self._items)
+
+    def add(self, perm):
+        if perm in self._positions:
+            return
+        set.add(self, perm)
+        self._positions[perm] = len(self._items)
+        self._items.append(perm)
+        n = len(perm)
+        if n not in self._buckets:
+            self._buckets[n] = PermSet()
+        self._buckets[n].add(perm)
+
+    def discard(self, perm):
+        if perm not in self._positions:
+            return
+        set.discard(self, perm)
+        # move the last item into the vacated slot to keep the array dense
+        idx = self._positions.pop(perm)
+        last = self._items.pop()
+        if idx < len(self._items):
+            self._items[idx] = last
+            self._positions[last] = idx
+        n = len(perm)
+        self._buckets[n].discard(perm)
+        if not self._buckets[n]:
+            del self._buckets[n]
+
+    def remove(self, perm):
+        if perm not in self._positions:
+            raise KeyError(perm)
+        self.discard(perm)
+
+    def pop(self):
+        if not self._items:
+            raise KeyError('pop from an empty set')
+        perm = self._items[-1]
+        self.discard(perm)
+        return perm
+
+    def clear(self):
+        set.clear(self)
+        self._items = []
+        self._positions = {}
+        self._buckets = {}
+
+    def update(self, *others):
+        for other in others:
+            for perm in other:
+                self.add(perm)
+
+    def difference_update(self, *others):
+        for other in others:
+            for perm in other:
+                self.discard(perm)
+
+    def intersection_update(self, *others):
+        keep = set(self).intersection(*others)
+        for perm in list(self._items):
+            if perm not in keep:
+                self.discard(perm)
+
+    def symmetric_difference_update(self, other):
+        for perm in set(other):
+            if perm in self._positions:
+                self.discard(perm)
+            else:
+                self.add(perm)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __isub__(self, other):
+        self.difference_update(other)
+        return self
+
+    def __iand__(self, other):
+        self.intersection_update(other)
+        return self
+
+    def __ixor__(self, other):
+        self.symmetric_difference_update(other)
+        return self
+
+    def get_random(self):
+        """Returns a uniformly random element of the set in constant time."""
+        return random.choice(self._items)
+
+    def get_length(self, length=None):
+        """Returns a copy of the bucket of permutations of the given length,
+        without scanning the other lengths."""
+        return PermSet(self._buckets.get(length, ()))
+
+    def by_length(self):
+        return dict((n, PermSet(bucket)) for (n, bucket) in self._buckets.items())
+
+    def iter_by_length(self):
+        for n in sorted(self._buckets):
+            for perm in self._buckets[n]:
+                yield perm
+
+    def __getitem__(self, idx):
+        """Returns the member at position `idx` of the internal array. The
+        order is arbitrary but stable while the set is not modified."""
+        return self._items[idx]
+
+
+class _MinimalTester(object):
+    """Tests which members of a set are minimal, holding the members of the
+    set by length, the shortest length, and the memoized patterns of one
+    call of `PermSet.minimal_elements`."""
+
+    def __init__(self, perms):
+        self.index = {}
+        for P in perms:
+            self.index.setdefault(len(P), set()).add(tuple(P))
+        self.lowest = min(self.index)
+        self.memo = {}
+
+    def meets_set(self, Q):
+        """Returns whether some pattern of the tuple `Q` (including `Q`) is
+        in the indexed set."""
+        result = self.memo.get(Q)
+        if result is None:
+            n = len(Q)
+            result = Q in self.index.get(n, ())
+            if not result and n > self.lowest:
+                for i in range(n):
+                    v = Q[i]
+                    child = tuple(w - (w > v) for w in Q[:i] + Q[i+1:])
+                    if self.meets_set(child):
+                        result = True
+                        break
+            self.memo[Q] = result
+        return result
+
+    def flags(self, perms):
+        """Returns, for each permutation of the indexed set in `perms`,
+        whether none of its proper patterns is in the set."""
+        flags = []
+        for P in perms:
+            Q = tuple(P)
+            minimal = True
+            if len(Q) > self.lowest:
+                for i in range(len(Q)):
+                    v = Q[i]
+                    if self.meets_set(tuple(w - (w > v) for w in Q[:i] + Q[i+1:])):
+                        minimal = False
+                        break
+            flags.append(minimal)
+        return flags
+
+
+# the tester of a worker process of `PermSet.minimal_elements`
+_minimal_tester = None
+
+
+def _init_minimal(perms):
+    global _minimal_tester
+    _minimal_tester = _MinimalTester(perms)
+
+
+def _minimal_flags(perms):
+    return _minimal_tester.flags(perms)
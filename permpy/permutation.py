@@ -6,6 +6,7 @@ import math
 import random
 import fractions
 import itertools
+import array
 
 
 # python 2/3 compatibility
@@ -17,6 +18,12 @@ try:
 except ImportError:
     mpl_imported = False
 
+try:
+    import numpy as np
+    np_imported = True
+except ImportError:
+    np_imported = False
+
 
 import permpy.permset
 
@@ -38,6 +45,7 @@ class Permutation(tuple):
     upper_bound = []
     bounds_set = False;
     insertion_locations = []
+    tracked_stats = ()
 
     # some useful functions for playing with permutations
 
@@ -178,6 +186,46 @@ class Permutation(tuple):
             standardization = Permutation.standardize(entries)
             return tuple.__new__(cls, standardization)
 
+    @classmethod
+    def _from_standard(cls, entries):
+        """Builds a permutation from a sequence which is already known to
+        consist of the integers 0 through n-1, skipping the checks and the
+        standardization done by the constructor."""
+        P = tuple.__new__(cls, entries)
+        P.__init__(P)
+        return P
+
+    @classmethod
+    def from_buffer(cls, buf, dtype='uint8', offset=0, n=None):
+        """Builds a permutation from a buffer (bytes, array, NumPy array,
+        memory map, ...) holding its 0-based entries. The buffer is read
+        through a zero-copy NumPy view, and the entries are copied once into
+        the (immutable) permutation without being standardized, so they must
+        be the integers 0 through n-1.
+
+        >>> Permutation.from_buffer(bytes([2, 0, 1]))
+        3 1 2
+        """
+        if not np_imported:
+            err = 'from_buffer requires numpy'
+            raise NotImplementedError(err)
+        view = np.frombuffer(buf, dtype=dtype, count=-1 if n is None else n,
+                             offset=offset)
+        return cls._from_standard(view.tolist())
+
+    def __array__(self, dtype=None, copy=None):
+        """Allows `numpy.asarray(p)` to build the array of 0-based entries."""
+        if dtype is None:
+            dtype = np.uint8 if len(self) <= 256 else np.uint16
+        return np.array(tuple(self), dtype=dtype)
+
+    def __buffer__(self, flags):
+        """Exposes the entries through the buffer protocol (Python 3.12+), as
+        unsigned bytes (or 16-bit integers for permutations longer than 256).
+        The buffer is a copy, as tuples do not store their items contiguously."""
+        typecode = 'B' if len(self) <= 256 else 'H'
+        return memoryview(array.array(typecode, self))
+
     # Not sure what this function does... Jay?
     def __init__(self,p,n=None):
         self.insertion_locations = [1]*(len(self)+1)
@@ -252,6 +300,61 @@ class Permutation(tuple):
             swap(i, q.index(i))
         return result
 
+    @classmethod
+    def ind2perm(cls, k, n):
+        """Returns the permutation of length `n` whose index (see
+        `Permutation.perm2ind`) is `k`, between 0 and n! - 1.
+
+        >>> [Permutation.ind2perm(k, 3).perm2ind() for k in range(6)]
+        [0, 1, 2, 3, 4, 5]
+        """
+        digits = []
+        for i in range(n-1, 0, -1):
+            (k, digit) = divmod(k, i+1)
+            digits.append(digit)
+        # undo the swaps of `perm2ind`, from the last one
+        q = list(range(n))
+        for (i, digit) in zip(range(1, n), reversed(digits)):
+            j = q.index(digit)
+            q[i], q[j] = q[j], q[i]
+        return cls._from_standard(q)
+
+    @staticmethod
+    def _pack_width(n):
+        """Number of bits used per entry when packing a permutation of
+        length `n`."""
+        return 4 if n <= 16 else (n-1).bit_length()
+
+    def pack(self):
+        """Encodes the permutation as a single integer, with the first entry in
+        the most significant position. Entries take 4 bits each for lengths up
+        to 16 (so the code fits in 64 bits), and the least sufficient width
+        otherwise. Together with the length, the code identifies the
+        permutation, and codes of permutations of the same length are ordered
+        lexicographically. See also `Permutation.unpack`.
+
+        >>> p = Permutation(31542)
+        >>> Permutation.unpack(p.pack(), len(p)) == p
+        True
+        """
+        width = Permutation._pack_width(len(self))
+        code = 0
+        for entry in self:
+            code = (code << width) | entry
+        return code
+
+    @classmethod
+    def unpack(cls, code, n):
+        """Decodes a permutation of length `n` from the integer produced by
+        `Permutation.pack`."""
+        width = Permutation._pack_width(n)
+        mask = (1 << width) - 1
+        entries = [0]*n
+        for i in range(n-1, -1, -1):
+            entries[i] = code & mask
+            code >>= width
+        return cls._from_standard(entries)
+
     def delete(self, idx):
         """Returns the permutation which results from deleting the entry at
         position `idx` from `self`. Recall that indices are zero-indexed.
@@ -971,8 +1074,10 @@ class Permutation(tuple):
         """Returns all patterns of length one less than the permutation."""
         return self.shrink_by_one()
 
-    def downset(self):
-        return permset.PermSet([self]).downset()
+    def downset(self, workers=None):
+        """Returns the set of patterns of the permutation; see
+        `PermSet.downset` for `workers`."""
+        return permpy.permset.PermSet([self]).downset(workers=workers)
 
     def sum_indecomposable_sequence(self):
         S = self.downset()
@@ -1054,14 +1159,26 @@ class Permutation(tuple):
         return P
 
     def all_syms(self):
-        S = permset.PermSet([self])
-        S = S.union(permset.PermSet([P.reverse() for P in S]))
-        S = S.union(permset.PermSet([P.complement() for P in S]))
-        S = S.union(permset.PermSet([P.inverse() for P in S]))
+        if np_imported:
+            from permpy.symmetries import all_symmetries
+            images = all_symmetries(np.asarray([self]))[:, 0, :]
+            return permpy.permset.PermSet(Permutation._from_standard(row)
+                                          for row in images.tolist())
+        S = permpy.permset.PermSet([self])
+        S = S.union(permpy.permset.PermSet([P.reverse() for P in S]))
+        S = S.union(permpy.permset.PermSet([P.complement() for P in S]))
+        S = S.union(permpy.permset.PermSet([P.inverse() for P in S]))
         return S
 
     def is_representative(self):
-        return self == sorted(self.all_syms())[0]
+        """Returns whether the permutation is the smallest of its orbit under
+        reverse, complement and inverse.
+
+        >>> Permutation(132).is_representative(), Permutation(231).is_representative()
+        (True, False)
+        """
+        from permpy.symmetries import is_canonical
+        return is_canonical(self)
 
     def greedy_sum(p):
         parts = []
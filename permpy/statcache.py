@@ -0,0 +1,165 @@
+"""Opt-in memoization of permutation statistics.
+
+Results are keyed by the name of the statistic together with the length and
+packed code of the permutation (see `Permutation.pack`), so that equal
+permutations share entries even when they come from different sets or
+classes. Each cache holds a bounded number of results and evicts the least
+recently used one when full.
+
+Statistics from `permpy.statistics` (or any function of a single permutation)
+can be wrapped with the `cached_statistic` decorator, while `enable` replaces
+the statistic methods of `Permutation` by cached versions until `disable` is
+called.
+
+>>> from permpy import statistics
+>>> cache = StatisticCache(maxsize=100)
+>>> inversions = cached_statistic(statistics.inversions, cache=cache)
+>>> inversions(Permutation(4132)), inversions(Permutation(4132))
+(4, 4)
+>>> cache.hits, cache.misses
+(1, 1)
+>>> cycles = cached_statistic(Permutation.cycle_decomp, cache=cache)
+>>> cycles(Permutation(2143))[0].append(9)
+>>> cycles(Permutation(2143))
+[[1, 0], [3, 2]]
+>>> cache.resize(1); len(cache)
+1
+"""
+
+import copy
+import functools
+from collections import OrderedDict
+
+from permpy.permutation import Permutation
+
+
+# Methods of `Permutation` which depend only on the permutation, and are
+# replaced by cached versions by `enable`.
+PERMUTATION_STATISTICS = [
+    'inversions', 'noninversions', 'majorindex', 'bonds', 'num_bonds',
+    'num_inc_bonds', 'num_dec_bonds', 'descents', 'ascents', 'ltrmin',
+    'rtlmin', 'ltrmax', 'rtlmax', 'num_ltrmin', 'longestrunA', 'longestrunD',
+    'longestrun', 'num_cycles', 'cycle_decomp', 'min_gapsize', 'is_simple',
+    'is_involution', 'sum_decomposable', 'skew_decomposable', 'rank_encoding',
+    'num_consecutive_3214', 'threepats', 'fourpats', 'fixed_points',
+    'num_rtlmax_ltrmin_layers',
+]
+
+
+class StatisticCache(object):
+    """Bounded least-recently-used store of statistic values, with hit and
+    miss counters."""
+
+    def __init__(self, maxsize=2**20):
+        self.maxsize = maxsize
+        self._store = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._store)
+
+    def __repr__(self):
+        return 'Statistic cache with {} of {} entries ({:.1%} hits)'.format(
+                    len(self), self.maxsize, self.hit_rate())
+
+    def lookup(self, name, perm, compute):
+        """Returns the value of the statistic `name` on `perm`, calling
+        `compute(perm)` only if it is not already cached."""
+        key = (name, len(perm), perm.pack())
+        try:
+            value = self._store[key]
+        except KeyError:
+            self.misses += 1
+            value = compute(perm)
+            self._store[key] = value
+            if len(self._store) > self.maxsize:
+                self._store.popitem(last=False)
+        else:
+            self.hits += 1
+            self._store.move_to_end(key)
+        # lists of positions, cycles and pattern counts are mutable (and
+        # may be nested), so hand out copies rather than the cached objects
+        if isinstance(value, (list, dict)):
+            return copy.deepcopy(value)
+        return value
+
+    def resize(self, maxsize):
+        """Sets the maximum number of entries, evicting the least recently
+        used ones if the cache holds more."""
+        self.maxsize = maxsize
+        while len(self._store) > self.maxsize:
+            self._store.popitem(last=False)
+
+    def hit_rate(self):
+        """Returns the fraction of lookups answered from the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def info(self):
+        """Returns a dictionary of counters describing the cache."""
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hit_rate(), 'size': len(self),
+                'maxsize': self.maxsize}
+
+    def clear(self):
+        """Removes all cached values and resets the counters."""
+        self._store.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+default_cache = StatisticCache()
+
+# original methods of `Permutation` replaced by `enable`
+_originals = {}
+
+
+def cached_statistic(func=None, cache=None, name=None):
+    """Decorator memoizing a statistic (a function of a single permutation)
+    in `cache`, which defaults to the module-level `default_cache`. The name
+    under which results are stored defaults to the qualified name of the
+    function. Can be used both as `@cached_statistic` and
+    `@cached_statistic(cache=...)`."""
+    if func is None:
+        return functools.partial(cached_statistic, cache=cache, name=name)
+    if name is None:
+        name = '{}.{}'.format(func.__module__, func.__name__)
+
+    @functools.wraps(func)
+    def wrapper(perm):
+        target = default_cache if cache is None else cache
+        return target.lookup(name, perm, func)
+    wrapper.uncached = func
+    return wrapper
+
+
+def enable(maxsize=None, cache=None):
+    """Replaces the statistic methods of `Permutation` listed in
+    `PERMUTATION_STATISTICS` with versions cached in `cache` (by default
+    `default_cache`, resized to `maxsize` if given)."""
+    if cache is None:
+        cache = default_cache
+    if maxsize is not None:
+        cache.resize(maxsize)
+    disable()
+    for method_name in PERMUTATION_STATISTICS:
+        method = getattr(Permutation, method_name, None)
+        if method is None:
+            continue
+        _originals[method_name] = method
+        setattr(Permutation, method_name,
+                cached_statistic(method, cache=cache,
+                                 name='Permutation.' + method_name))
+    return cache
+
+
+def disable():
+    """Restores the uncached statistic methods of `Permutation`."""
+    for (method_name, method) in _originals.items():
+        setattr(Permutation, method_name, method)
+    _originals.clear()
+
+
+def is_enabled():
+    return len(_originals) > 0
@@ -0,0 +1,323 @@
+"""Binary on-disk format for sets and classes of permutations.
+
+A file starts with the magic bytes `PERMPY01`, the length of a JSON header as
+a little-endian 32-bit integer, and the header itself. The header records the
+basis (if any) and, for each length, the number of permutations and where
+their data starts. The permutations of each length are stored as a sorted
+array, either of their ranks (see `Permutation.perm2ind`, for lengths up to
+20) or of their rows of entries in lexicographic order (for longer
+permutations, or when the writer asks for them, since rows are faster to
+encode and decode than ranks). Arrays are aligned to 64 bytes so that they can be opened with
+`numpy.memmap`: opening a file only reads the header, and membership is a
+binary search into the mapped array.
+
+>>> import os, tempfile
+>>> path = os.path.join(tempfile.mkdtemp(), 'S4.perms')
+>>> save(path, PermSet.all(4) + PermSet.all(2))
+>>> F = PermFile(path)
+>>> F.lengths, len(F), Permutation(2413) in F
+([2, 4], 26, True)
+"""
+
+import itertools
+import json
+import os
+import pickle
+import struct
+
+try:
+    import numpy as np
+    np_imported = True
+except ImportError:
+    np_imported = False
+
+from permpy.permutation import Permutation
+from permpy.permset import PermSet
+
+
+MAGIC = b'PERMPY01'
+ALIGNMENT = 64
+
+# longest permutations stored by rank (20! < 2**63)
+MAX_RANK_LENGTH = 20
+
+
+def _require_numpy():
+    if not np_imported:
+        err = 'reading and writing permutation files requires numpy'
+        raise NotImplementedError(err)
+
+
+def encode_level(perms, n, encoding=None):
+    """Returns the sorted array representing the permutations of length `n`
+    in `perms`, together with the name of its encoding: 'rank' or 'entries'
+    as given by `encoding`, or by default 'rank' for lengths up to
+    `MAX_RANK_LENGTH`.
+
+    >>> encode_level([Permutation(21), Permutation(12)], 2, 'entries')[0].tolist()
+    [[0, 1], [1, 0]]
+    """
+    if encoding is None:
+        encoding = 'rank' if n <= MAX_RANK_LENGTH else 'entries'
+    if encoding == 'rank':
+        data = np.array([Permutation(P).perm2ind() for P in perms], dtype=np.uint64)
+        data.sort()
+        return (data, 'rank')
+    if encoding != 'entries':
+        err = 'Unknown encoding {}'.format(encoding)
+        raise ValueError(err)
+    perms = list(perms)
+    dtype = np.uint8 if n <= 256 else np.uint16
+    data = np.fromiter(itertools.chain.from_iterable(perms), dtype=dtype,
+                       count=len(perms)*n).reshape(len(perms), n)
+    if len(data):
+        data = data[np.lexsort(data.T[::-1])]
+    return (data, 'entries')
+
+
+def write(path, levels, basis=None, arrays=None, kind='PermSet', meta=None,
+          encoding=None):
+    """Writes a permutation file. The file is written next to `path` and
+    renamed over it, so that an interrupted write leaves any previous file
+    intact.
+
+    Parameters
+    ----------
+    levels : dict
+        maps each length to an iterable of permutations of that length, or to
+        a pair (data, encoding) as returned by `encode_level`
+    basis : list of permutations (optional)
+    arrays : dict (optional)
+        additional named NumPy arrays to store alongside the levels
+    kind : str
+        'PermSet' or 'PermClass', recorded to choose the type on loading
+    meta : dict (optional)
+        additional JSON-serializable data to record in the header
+    encoding : str (optional)
+        encoding of the levels given as permutations (see `encode_level`)
+    """
+    _require_numpy()
+    blocks = []
+    header = {'kind': kind, 'levels': [], 'arrays': {},
+              'basis': [list(map(int, b)) for b in basis] if basis is not None else None}
+    if meta is not None:
+        header['meta'] = meta
+    for n in sorted(levels):
+        level = levels[n]
+        if isinstance(level, tuple):
+            (data, stored) = level
+        else:
+            (data, stored) = encode_level(level, n, encoding)
+        header['levels'].append({'length': n, 'count': len(data),
+                                 'encoding': stored})
+        blocks.append((header['levels'][-1], data))
+    for (name, data) in (arrays or {}).items():
+        header['arrays'][name] = {}
+        blocks.append((header['arrays'][name], np.ascontiguousarray(data)))
+
+    # offsets depend on the size of the header, which contains them, so
+    # reserve a generous fixed width for each offset while measuring
+    for (entry, data) in blocks:
+        entry.update({'dtype': data.dtype.str, 'shape': list(data.shape),
+                      'offset': 10**15})
+    start = _align(len(MAGIC) + 4 + len(json.dumps(header).encode('utf-8')))
+    offset = start
+    for (entry, data) in blocks:
+        entry['offset'] = offset
+        offset = _align(offset + data.nbytes)
+    encoded = json.dumps(header).encode('utf-8')
+    encoded += b' '*(start - len(MAGIC) - 4 - len(encoded))
+
+    temp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(encoded)))
+        f.write(encoded)
+        for (entry, data) in blocks:
+            f.write(b'\0'*(entry['offset'] - f.tell()))
+            f.write(data.tobytes())
+    os.replace(temp, path)
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def save(path, S, basis=None):
+    """Saves a set of permutations (of possibly different lengths)."""
+    write(path, S.by_length() if hasattr(S, 'by_length') else PermSet(S).by_length(),
+          basis=basis)
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        magic = f.read(len(MAGIC))
+        if magic != MAGIC:
+            err = '{} is not a permutation file'.format(path)
+            raise ValueError(err)
+        (size,) = struct.unpack('<I', f.read(4))
+        return json.loads(f.read(size).decode('utf-8'))
+
+
+def _map(path, entry, mmap=True):
+    shape = tuple(entry['shape'])
+    dtype = np.dtype(entry['dtype'])
+    if 0 in shape:
+        return np.zeros(shape, dtype=dtype)
+    if mmap:
+        return np.memmap(path, dtype=dtype, mode='r', offset=entry['offset'],
+                         shape=shape)
+    with open(path, 'rb') as f:
+        f.seek(entry['offset'])
+        count = int(np.prod(shape))
+        return np.fromfile(f, dtype=dtype, count=count).reshape(shape)
+
+
+class StoredLevel(object):
+    """Read-only set of the permutations of one length stored in a file."""
+
+    def __init__(self, length, data, encoding):
+        self.length = length
+        self.data = data
+        self.encoding = encoding
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return 'Stored set of {} permutations of length {}'.format(
+                    len(self), self.length)
+
+    def _key(self, P):
+        if self.encoding == 'rank':
+            return np.uint64(Permutation(P).perm2ind())
+        return tuple(P)
+
+    def index(self, P):
+        """Returns the position of `P` in the sorted data, or -1."""
+        if len(P) != self.length or len(self.data) == 0:
+            return -1
+        key = self._key(P)
+        if self.encoding == 'rank':
+            i = int(np.searchsorted(self.data, key))
+            found = i < len(self.data) and self.data[i] == key
+            return i if found else -1
+        (lo, hi) = (0, len(self.data))
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if tuple(self.data[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        found = lo < len(self.data) and tuple(self.data[lo]) == key
+        return lo if found else -1
+
+    def __contains__(self, P):
+        return self.index(P) >= 0
+
+    def __iter__(self):
+        for start in range(0, len(self.data), 65536):
+            chunk = np.asarray(self.data[start:start+65536])
+            if self.encoding == 'rank':
+                for rank in chunk.tolist():
+                    yield Permutation.ind2perm(rank, self.length)
+            else:
+                for row in chunk.tolist():
+                    yield Permutation._from_standard(row)
+
+    def to_permset(self):
+        return PermSet(self)
+
+
+class PermFile(object):
+    """A permutation file opened for reading. Levels are memory-mapped (when
+    `mmap` is true) and exposed as `StoredLevel` objects; the file as a whole
+    behaves as a read-only set of permutations."""
+
+    def __init__(self, path, mmap=True):
+        _require_numpy()
+        self.path = path
+        self.header = read_header(path)
+        basis = self.header.get('basis')
+        self.basis = None if basis is None else [Permutation(b) for b in basis]
+        self.kind = self.header.get('kind', 'PermSet')
+        self.meta = self.header.get('meta')
+        self.levels = {}
+        for entry in self.header['levels']:
+            n = entry['length']
+            self.levels[n] = StoredLevel(n, _map(path, entry, mmap),
+                                         entry['encoding'])
+        self.arrays = {name: _map(path, entry, mmap)
+                       for (name, entry) in self.header['arrays'].items()}
+
+    @property
+    def lengths(self):
+        return sorted(self.levels)
+
+    def __getitem__(self, n):
+        return self.levels[n]
+
+    def __len__(self):
+        return sum(len(level) for level in self.levels.values())
+
+    def __contains__(self, P):
+        return len(P) in self.levels and P in self.levels[len(P)]
+
+    def __iter__(self):
+        for n in self.lengths:
+            for P in self.levels[n]:
+                yield P
+
+    def __repr__(self):
+        return 'Permutation file {} ({} permutations)'.format(self.path, len(self))
+
+    def to_permset(self):
+        return PermSet(self)
+
+
+def dump_checkpoint(path, state, items=(), chunk=1 << 16):
+    """Writes a checkpoint of a long computation to `path`: the pickled
+    `state`, followed by the members of the iterable `items` pickled in
+    chunks (so that they need not be held in memory at once). As with
+    `write`, the previous checkpoint is only replaced once the new one is
+    complete.
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'run.ckpt')
+    >>> dump_checkpoint(path, {'layer': 3}, iter(range(5)), chunk=2)
+    >>> (state, items) = load_checkpoint(path)
+    >>> state, list(items)
+    ({'layer': 3}, [0, 1, 2, 3, 4])
+    """
+    temp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temp, 'wb') as f:
+        pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        block = []
+        for item in items:
+            block.append(item)
+            if len(block) >= chunk:
+                pickle.dump(block, f, pickle.HIGHEST_PROTOCOL)
+                block = []
+        if block:
+            pickle.dump(block, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(temp, path)
+
+
+def load_checkpoint(path):
+    """Reads a checkpoint written by `dump_checkpoint`, returning the state
+    and an iterator over the items, which are read from the file lazily."""
+    with open(path, 'rb') as f:
+        state = pickle.load(f)
+    return (state, _checkpoint_items(path))
+
+
+def _checkpoint_items(path):
+    with open(path, 'rb') as f:
+        pickle.load(f)
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            for item in block:
+                yield item
@@ -0,0 +1,336 @@
+"""Batch symmetries of permutations.
+
+The eight symmetries of the square act on permutations through reverse,
+complement and inverse. The functions of this module apply them to a whole
+(m, n) matrix of same-length permutations (0-based entries, one per row) with
+NumPy indexing, instead of building new `Permutation` objects one at a time.
+For single permutations, `canonical_form` computes the orbit data directly
+from the entries, and `OrbitIndex` caches it for a whole level.
+
+Symmetries are numbered 0 to 7 as in `SYMMETRIES`: bit 4 takes the inverse
+first, then bit 1 reverses and bit 2 complements.
+
+>>> M = np.array([[1, 2, 0], [0, 2, 1]])
+>>> apply_symmetry(M, 5).tolist()
+[[1, 0, 2], [1, 2, 0]]
+>>> canonical_array(M).tolist()
+[[0, 2, 1], [0, 2, 1]]
+"""
+
+try:
+    import numpy as np
+    np_imported = True
+except ImportError:
+    np_imported = False
+
+from permpy.permutation import Permutation
+
+
+SYMMETRIES = ('identity', 'reverse', 'complement', 'reverse_complement',
+              'inverse', 'inverse_reverse', 'inverse_complement',
+              'inverse_reverse_complement')
+
+# number of the inverse of each symmetry
+INVERSES = (0, 1, 2, 3, 4, 6, 5, 7)
+
+
+def _require_numpy():
+    if not np_imported:
+        err = 'batch symmetries require numpy'
+        raise NotImplementedError(err)
+
+
+def reverse_array(M):
+    """Returns the reverses of the rows of `M`."""
+    _require_numpy()
+    return np.ascontiguousarray(np.asarray(M)[:, ::-1])
+
+
+def complement_array(M):
+    """Returns the complements of the rows of `M`."""
+    _require_numpy()
+    M = np.asarray(M)
+    return (M.shape[1] - 1) - M if M.shape[1] else M.copy()
+
+
+def inverse_array(M):
+    """Returns the inverses of the rows of `M`."""
+    _require_numpy()
+    M = np.asarray(M)
+    (m, n) = M.shape
+    result = np.empty_like(M)
+    rows = np.arange(m)[:, None]
+    result[rows, M] = np.arange(n, dtype=M.dtype)
+    return result
+
+
+def apply_symmetry(M, k):
+    """Applies symmetry number `k` (see `SYMMETRIES`) to every row of `M`."""
+    _require_numpy()
+    M = np.asarray(M)
+    if k & 4:
+        M = inverse_array(M)
+    if k & 1:
+        M = M[:, ::-1]
+    if k & 2 and M.shape[1]:
+        M = (M.shape[1] - 1) - M
+    return np.ascontiguousarray(M)
+
+
+def all_symmetries(M):
+    """Returns the (8, m, n) array of the images of the rows of `M` under
+    each of the symmetries, in the order of `SYMMETRIES`."""
+    _require_numpy()
+    M = np.asarray(M)
+    if M.dtype.kind not in 'iu':
+        M = M.astype(np.int64)
+    n = M.shape[1]
+    result = np.empty((8,) + M.shape, dtype=M.dtype)
+    result[0] = M
+    if n == 0:
+        result[1:] = M
+        return result
+    result[4] = inverse_array(M)
+    for k in (0, 4):
+        result[k+1] = result[k][:, ::-1]
+        result[k+2] = (n - 1) - result[k]
+        result[k+3] = (n - 1) - result[k+1]
+    return result
+
+
+def _lex_less(A, B):
+    """Returns whether each row of `A` is lexicographically smaller than the
+    corresponding row of `B`."""
+    if A.shape[1] == 0:
+        return np.zeros(len(A), dtype=bool)
+    differ = A != B
+    first = differ.argmax(axis=1)
+    rows = np.arange(len(A))
+    return differ.any(axis=1) & (A[rows, first] < B[rows, first])
+
+
+def canonical_array(M, return_symmetry=False, group=None):
+    """Returns the canonical representative (the lexicographically smallest
+    image under the symmetries) of each row of `M`. If `return_symmetry` is
+    true, also returns the number of the first symmetry reaching it. If
+    `group` is given, only the symmetries with these numbers are used."""
+    images = all_symmetries(M)
+    best = images[0].copy()
+    which = np.zeros(len(best), dtype=np.uint8)
+    for k in (range(1, 8) if group is None else group):
+        if k == 0:
+            continue
+        smaller = _lex_less(images[k], best)
+        best[smaller] = images[k][smaller]
+        which[smaller] = k
+    if return_symmetry:
+        return (best, which)
+    return best
+
+
+def orbit_sizes(M, group=None):
+    """Returns the size of the orbit of each row of `M` under the symmetries
+    (or those in `group`), as the number of distinct images of the row.
+
+    >>> orbit_sizes(np.array([[1, 3, 0, 2], [1, 3, 2, 0]])).tolist()
+    [2, 8]
+    """
+    images = all_symmetries(M)
+    if group is None:
+        group = range(8)
+    fixed = sum((images[k] == images[0]).all(axis=1).astype(np.int64)
+                for k in group)
+    return len(group) // fixed
+
+
+def is_canonical_array(M):
+    """Returns whether each row of `M` is its own canonical representative."""
+    M = np.asarray(M)
+    return (canonical_array(M) == M).all(axis=1)
+
+
+def set_orbit_key(perms):
+    """Returns a hashable key shared exactly by the sets of permutations which
+    are images of each other under one of the symmetries: the smallest, over
+    the symmetries, of the sorted tuple of images of the members."""
+    _require_numpy()
+    groups = {}
+    for P in perms:
+        groups.setdefault(len(P), []).append(tuple(P))
+    images = [[] for k in range(8)]
+    for (n, group) in groups.items():
+        M = np.array(group, dtype=np.int64).reshape(-1, n)
+        for (k, image) in enumerate(all_symmetries(M)):
+            images[k].extend(map(tuple, image.tolist()))
+    return min(tuple(sorted(image)) for image in images)
+
+
+def _inverse_entries(P):
+    inverse = [0]*len(P)
+    for (i, v) in enumerate(P):
+        inverse[v] = i
+    return inverse
+
+
+def _image_entry(P, inverse, k, j):
+    """Returns entry j of the image of P under symmetry k."""
+    n = len(P)
+    v = (inverse if k & 4 else P)[n-1-j if k & 1 else j]
+    return n-1-v if k & 2 else v
+
+
+def _compare_image(P, inverse, k):
+    """Compares the image of P under symmetry k with P itself, entry by entry,
+    stopping at the first difference. Returns -1, 0 or 1."""
+    for j in range(len(P)):
+        v = _image_entry(P, inverse, k, j)
+        if v != P[j]:
+            return -1 if v < P[j] else 1
+    return 0
+
+
+def image(P, k):
+    """Returns the image of the permutation `P` under symmetry number `k`.
+
+    >>> image(Permutation(231), 4)
+    3 1 2
+    """
+    inverse = _inverse_entries(P) if k & 4 else None
+    return Permutation._from_standard(
+                [_image_entry(P, inverse, k, j) for j in range(len(P))])
+
+
+def is_canonical(P):
+    """Returns whether `P` is the smallest permutation of its orbit. Each
+    image is only compared up to its first difference with `P`."""
+    inverse = _inverse_entries(P)
+    return all(_compare_image(P, inverse, k) >= 0 for k in range(1, 8))
+
+
+def canonical_form(P, group=None):
+    """Returns the canonical representative of `P` (the smallest member of
+    its orbit under the symmetries), the size of the orbit and the
+    stabilizer of `P`, as the tuple of numbers of the symmetries fixing it.
+    If `group` is given, only the symmetries with these numbers (which must
+    form a group) are used.
+
+    >>> canonical_form(Permutation(2413))
+    (2 4 1 3, 2, (0, 3, 5, 6))
+    >>> canonical_form(Permutation(2431))
+    (1 3 4 2, 8, (0,))
+    >>> canonical_form(Permutation(2431), group=(0, 2))
+    (2 4 3 1, 2, (0,))
+    """
+    if group is None:
+        group = range(8)
+    inverse = _inverse_entries(P)
+    stabilizer = [0]
+    best = 0
+    for k in group:
+        if k == 0:
+            continue
+        if _compare_image(P, inverse, k) == 0:
+            stabilizer.append(k)
+            continue
+        # compare with the best image so far, again up to the first difference
+        for j in range(len(P)):
+            v = _image_entry(P, inverse, k, j)
+            w = _image_entry(P, inverse, best, j)
+            if v != w:
+                if v < w:
+                    best = k
+                break
+    return (image(P, best), len(group) // len(stabilizer), tuple(stabilizer))
+
+
+def set_symmetries(perms):
+    """Returns the numbers of the symmetries mapping the set `perms` to
+    itself. They form a group, under which the class of permutations
+    avoiding `perms` is invariant too.
+
+    >>> set_symmetries([Permutation(123), Permutation(321)])
+    (0, 1, 2, 3, 4, 5, 6, 7)
+    >>> set_symmetries([Permutation(132)])
+    (0, 4)
+    """
+    perms = set(Permutation(P) for P in perms)
+    return tuple(k for k in range(8)
+                 if set(image(P, k) for P in perms) == perms)
+
+
+class OrbitIndex(object):
+    """Partition of a collection of permutations into orbits under the
+    symmetries. The canonical form of an orbit is computed once, when its
+    first member is added, and recorded for all of its images; after that,
+    the representative and orbit of any of them are dictionary lookups.
+
+    >>> index = OrbitIndex(Permutation.listall(3))
+    >>> len(index), sorted(index.representatives())
+    (2, [1 2 3, 1 3 2])
+    >>> index.orbit(Permutation(231))
+    [1 3 2, 2 1 3, 2 3 1, 3 1 2]
+    >>> index.orbit_size(Permutation(321))
+    2
+    """
+
+    def __init__(self, perms=()):
+        self._representative = {}
+        self._sizes = {}
+        self._orbits = {}
+        self._members = set()
+        self.update(perms)
+
+    def _lookup(self, P):
+        """Returns the representative of `P`, recording its whole orbit."""
+        rep = self._representative.get(P)
+        if rep is None:
+            (rep, size, stabilizer) = canonical_form(P)
+            for k in range(8):
+                self._representative[image(P, k)] = rep
+            self._sizes[rep] = size
+        return rep
+
+    def add(self, P):
+        if P in self._members:
+            return
+        rep = self._lookup(P)
+        self._members.add(P)
+        self._orbits.setdefault(rep, []).append(P)
+
+    def update(self, perms):
+        for P in perms:
+            self.add(P)
+
+    def __len__(self):
+        """Returns the number of orbits with a member in the index."""
+        return len(self._orbits)
+
+    def __contains__(self, P):
+        return P in self._members
+
+    def __iter__(self):
+        return iter(self._members)
+
+    def representative(self, P):
+        """Returns the canonical representative of the orbit of `P`, which
+        need not itself be in the index."""
+        return self._lookup(P)
+
+    def is_representative(self, P):
+        return self._lookup(P) == P
+
+    def representatives(self):
+        """Returns the canonical representatives of the indexed orbits."""
+        return list(self._orbits)
+
+    def orbit(self, P):
+        """Returns the sorted list of indexed members of the orbit of `P`."""
+        return sorted(self._orbits.get(self._lookup(P), []))
+
+    def orbit_size(self, P):
+        """Returns the size of the full orbit of `P` under the symmetries."""
+        return self._sizes[self._lookup(P)]
+
+    def __repr__(self):
+        return 'Orbit index of {} permutations in {} orbits'.format(
+                    len(self._members), len(self))
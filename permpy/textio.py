@@ -0,0 +1,227 @@
+"""Bulk reading and writing of permutations in text form.
+
+Files contain one permutation per line, either as space-separated entries
+(`3 1 4 2`) or as a string of digits (`3142`, for lengths up to 9). Entries
+may be 0- or 1-based; by default the base is detected once, from the
+smallest entry of the first line, and every line must then be a permutation
+of the entries from that base. Files ending in `.gz` (or starting with the gzip magic bytes)
+are compressed and decompressed on the fly.
+
+Files are read in chunks of lines which are parsed with NumPy into (m, n)
+matrices of entries, one per length, so that large files can be streamed and
+filtered without creating a Python object per permutation:
+
+>>> import os, tempfile
+>>> path = os.path.join(tempfile.mkdtemp(), 'perms.txt.gz')
+>>> with ArrayWriter(path) as writer:
+...     writer.write([[2, 0, 1], [0, 1, 2]])
+>>> [M.tolist() for M in iter_arrays(path)]
+[[[2, 0, 1], [0, 1, 2]]]
+>>> from permpy.permset import PermSet
+>>> PermSet.from_file(path) == PermSet([Permutation(312), Permutation(123)])
+True
+>>> list(iter_arrays(io.BytesIO(b'1 2 3\\n4 5 6\\n')))
+Traceback (most recent call last):
+...
+ValueError: Line 2 is not a permutation
+"""
+
+import gzip
+import io
+import itertools
+
+try:
+    import numpy as np
+    np_imported = True
+except ImportError:
+    np_imported = False
+
+from permpy.permutation import Permutation
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def _require_numpy():
+    if not np_imported:
+        err = 'bulk text input and output requires numpy'
+        raise NotImplementedError(err)
+
+
+def _open(path_or_file, mode):
+    """Opens a (possibly gzipped) file in binary mode. Returns the file and
+    whether it should be closed by the caller."""
+    if hasattr(path_or_file, 'read' if 'r' in mode else 'write'):
+        return (path_or_file, False)
+    if 'r' in mode:
+        with open(path_or_file, 'rb') as f:
+            compressed = f.read(2) == GZIP_MAGIC
+    else:
+        compressed = str(path_or_file).endswith('.gz')
+    if compressed:
+        return (gzip.open(path_or_file, mode + 'b'), True)
+    return (io.open(path_or_file, mode + 'b', buffering=1 << 20), True)
+
+
+def _parse_lines(lines, numbers, digits):
+    """Parses a list of non-empty byte strings of the same shape into a
+    matrix of entries. `numbers` are the line numbers of the lines, used to
+    report a line which cannot be parsed."""
+    if digits:
+        n = len(lines[0])
+        M = np.frombuffer(b''.join(lines), dtype=np.uint8).reshape(-1, n)
+        return M.astype(np.int64) - ord('0')
+    n = len(lines[0].split())
+    try:
+        M = np.array(b' '.join(lines).split()).astype(np.int64)
+    except ValueError:
+        for (number, line) in zip(numbers, lines):
+            try:
+                [int(token) for token in line.split()]
+            except ValueError:
+                err = 'Line {} is not a permutation'.format(number)
+                raise ValueError(err)
+        raise
+    return M.reshape(-1, n)
+
+
+def _check_rows(M, numbers):
+    n = M.shape[1]
+    bad = np.flatnonzero((np.sort(M, axis=1) != np.arange(n)).any(axis=1))
+    if len(bad):
+        err = 'Line {} is not a permutation'.format(numbers[int(bad[0])])
+        raise ValueError(err)
+
+
+def iter_arrays(path_or_file, base=None, chunk_lines=1 << 16, dtype=None):
+    """Reads a file of permutations in chunks, yielding (m, n) arrays of
+    0-based entries. Each array holds consecutive permutations of the same
+    length, in file order.
+
+    Parameters
+    ----------
+    base : 0, 1 or None
+        base of the entries in the file; if None, it is the smallest entry of
+        the first line, which must be 0 or 1
+    chunk_lines : int
+        number of lines read and parsed at a time
+    dtype : NumPy dtype (optional)
+        type of the yielded arrays; by default the smallest unsigned type
+        which can hold the entries
+    """
+    _require_numpy()
+    (f, close) = _open(path_or_file, 'r')
+    line_number = 0
+    # the base detected from the first line, shared by all the runs
+    bases = [base]
+    try:
+        while True:
+            lines = list(itertools.islice(f, chunk_lines))
+            if not lines:
+                break
+            # split the chunk into runs of lines of the same length and
+            # format (a line without whitespace is a string of digits)
+            run = []
+            numbers = []
+            run_key = None
+            for line in lines:
+                line_number += 1
+                line = line.strip()
+                if not line:
+                    continue
+                tokens = len(line.split())
+                key = (True, len(line)) if tokens == 1 else (False, tokens)
+                if key != run_key and run:
+                    yield _finish(run, numbers, bases, run_key[0], dtype)
+                    run = []
+                    numbers = []
+                run_key = key
+                run.append(line)
+                numbers.append(line_number)
+            if run:
+                yield _finish(run, numbers, bases, run_key[0], dtype)
+    finally:
+        if close:
+            f.close()
+
+
+def _finish(lines, numbers, bases, digits, dtype):
+    M = _parse_lines(lines, numbers, digits)
+    if bases[0] is None:
+        bases[0] = int(M[0].min()) if M.shape[1] else 1
+        if bases[0] not in (0, 1):
+            err = 'Line {} is not a permutation of 0-based or 1-based entries'.format(
+                        numbers[0])
+            raise ValueError(err)
+    M -= bases[0]
+    _check_rows(M, numbers)
+    if dtype is None:
+        dtype = np.uint8 if M.shape[1] <= 256 else np.uint32
+    return M.astype(dtype)
+
+
+def iter_permutations(path_or_file, base=None, chunk_lines=1 << 16):
+    """Reads a file of permutations, yielding Permutation objects."""
+    for M in iter_arrays(path_or_file, base=base, chunk_lines=chunk_lines):
+        for row in M.tolist():
+            yield Permutation._from_standard(row)
+
+
+class ArrayWriter(object):
+    """Buffered writer of permutations, given as (m, n) arrays of 0-based
+    entries or as lists of permutations. Use as a context manager.
+
+    Parameters
+    ----------
+    base : int
+        base of the written entries (1 by default, like `Permutation.oneline`)
+    digits : Boolean
+        write each permutation as a string of digits instead of
+        space-separated entries (only for lengths up to 9)
+    """
+
+    def __init__(self, path_or_file, base=1, digits=False):
+        _require_numpy()
+        self.base = base
+        self.digits = digits
+        (self.f, self._close) = _open(path_or_file, 'w')
+
+    def write(self, M):
+        M = np.asarray(M, dtype=np.int64)
+        if M.ndim != 2 or len(M) == 0:
+            return
+        n = M.shape[1]
+        if self.digits:
+            if n + self.base > 10:
+                err = 'digit strings can only hold permutations of length at most {}'.format(10 - self.base)
+                raise ValueError(err)
+            out = np.empty((len(M), n + 1), dtype=np.uint8)
+            out[:, :n] = M + self.base + ord('0')
+            out[:, n] = ord('\n')
+            self.f.write(out.tobytes())
+        else:
+            names = [str(i + self.base) for i in range(n)]
+            text = '\n'.join(' '.join([names[v] for v in row]) for row in M.tolist())
+            self.f.write(text.encode('ascii') + b'\n')
+
+    def write_permutations(self, perms):
+        """Writes an iterable of permutations, grouping them by length."""
+        groups = {}
+        for P in perms:
+            groups.setdefault(len(P), []).append(P)
+        for (n, group) in sorted(groups.items()):
+            for start in range(0, len(group), 1 << 16):
+                chunk = group[start:start + (1 << 16)]
+                self.write(np.array(chunk, dtype=np.int64).reshape(-1, n))
+
+    def close(self):
+        if self._close:
+            self.f.close()
+        else:
+            self.f.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
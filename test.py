@@ -1,8 +1,23 @@
 
 import permpy
+import permpy.statcache
+import permpy.packedpermset
+import permpy.storage
+import permpy.textio
+import permpy.symmetries
+import permpy.downsets
+import permpy.enumcache
 import doctest
 
 doctest.testmod(permpy.permutation)
 doctest.testmod(permpy.permset)
 doctest.testmod(permpy.permclass)
 doctest.testmod(permpy.avclass)
+doctest.testmod(permpy.statcache)
+doctest.testmod(permpy.bitmapset)
+doctest.testmod(permpy.packedpermset)
+doctest.testmod(permpy.storage)
+doctest.testmod(permpy.textio)
+doctest.testmod(permpy.symmetries)
+doctest.testmod(permpy.downsets)
+doctest.testmod(permpy.enumcache)